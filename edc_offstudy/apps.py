@@ -1,7 +1,4 @@
-import sys
-
 from django.apps import AppConfig as DjangoAppConfig
-from django.conf import settings
 
 
 class EdcOffstudyAppConfigError(Exception):
@@ -15,33 +12,32 @@ MODEL_LABEL = 1
 class AppConfig(DjangoAppConfig):
     name = 'edc_offstudy'
     verbose_name = 'Edc Offstudy'
+    # serializes off-study, CRF and non-CRF saves per subject,
+    # one of None, 'select_for_update' or 'advisory'. See locks.py
+    lock_mode = None
+    # if True, keeps appointments deleted by Offstudy for bulk
+    # restore. See PurgedAppointment
+    soft_purge = False
+    # if True, off-study checks read a per-process snapshot,
+    # see OffstudySnapshot
+    offstudy_snapshot = False
+    # seconds between polls of OffstudyGeneration for changes made
+    # by other processes, None to disable. See Generations.poll
+    generation_poll_interval = None
+    # days off study after which CRF data may be archived, None
+    # to require --days. See CrfArchive
+    archive_after_days = None
 
     def ready(self):
-        from .signals import offstudy_model_on_post_save
-        sys.stdout.write('Loading {} ...\n'.format(self.verbose_name))
-        # sys.stdout.write('  * using offstudy models from \'{}\'\n'.format(self.app_label))
-        sys.stdout.write(' Done loading {}.\n'.format(self.verbose_name))
-
-
-if settings.APP_NAME == 'edc_offstudy':
-
-    from dateutil.relativedelta import SU, MO, TU, WE, TH, FR, SA
-    from edc_appointment.appointment_config import AppointmentConfig
-    from edc_appointment.apps import AppConfig as BaseEdcAppointmentAppConfig
-    from edc_facility.apps import AppConfig as BaseEdcFacilityAppConfig
-    from edc_visit_tracking.apps import AppConfig as BaseEdcVisitTrackingAppConfig
-
-    class EdcVisitTrackingAppConfig(BaseEdcVisitTrackingAppConfig):
-        visit_models = {
-            'edc_offstudy': ('subject_visit', 'edc_offstudy.subjectvisit')}
-
-    class EdcAppointmentAppConfig(BaseEdcAppointmentAppConfig):
-        configurations = [
-            AppointmentConfig(
-                model='edc_appointment.appointment',
-                related_visit_model='edc_offstudy.subjectvisit')]
-
-    class EdcFacilityAppConfig(BaseEdcFacilityAppConfig):
-        definitions = {
-            'default': dict(days=[MO, TU, WE, TH, FR, SA, SU],
-                            slots=[100, 100, 100, 100, 100])}
+        from django.core.checks import register
+        from .checks import check_offstudy_models, check_visit_schedules
+        from .checks import check_crf_models
+        from .signals import connect_offstudy_model_receivers
+        from .signals import connect_subject_facts_receivers
+        from .site_offstudy_models import site_offstudy_models
+        connect_offstudy_model_receivers()
+        connect_subject_facts_receivers()
+        register(check_offstudy_models)
+        register(check_visit_schedules)
+        register(check_crf_models)
+        site_offstudy_models.load()
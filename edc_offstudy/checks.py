@@ -0,0 +1,78 @@
+from django.apps import apps as django_apps
+from django.core.checks import Error
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+from .site_offstudy_models import get_visit_schedule_name
+from .utils import get_visit_field
+
+
+def check_offstudy_models(app_configs, **kwargs):
+    """Checks that each off-study model declares a valid
+    Meta.consent_model.
+    """
+    from .model_mixins import OffstudyModelMixin
+    errors = []
+    for model_cls in django_apps.get_models():
+        if issubclass(model_cls, OffstudyModelMixin):
+            consent_model = getattr(model_cls._meta, 'consent_model', None)
+            try:
+                django_apps.get_model(consent_model)
+            except (LookupError, ValueError, TypeError, AttributeError):
+                errors.append(Error(
+                    f'Invalid consent model. Got Meta.consent_model={consent_model}.',
+                    hint='Declare Meta.consent_model as a valid model label_lower.',
+                    obj=model_cls,
+                    id='edc_offstudy.E001'))
+    return errors
+
+
+def check_visit_schedules(app_configs, **kwargs):
+    """Checks that each visit schedule's offstudy_model is
+    an off-study model.
+    """
+    from .model_mixins import OffstudyModelMixin
+    errors = []
+    for visit_schedule in site_visit_schedules.registry.values():
+        try:
+            model_cls = django_apps.get_model(visit_schedule.offstudy_model)
+        except (LookupError, ValueError, TypeError):
+            model_cls = None
+        if not model_cls or not issubclass(model_cls, OffstudyModelMixin):
+            errors.append(Error(
+                f'Invalid off-study model for visit schedule {visit_schedule.name}. '
+                f'Got {visit_schedule.offstudy_model}.',
+                hint='The off-study model must use OffstudyModelMixin.',
+                obj=visit_schedule,
+                id='edc_offstudy.E002'))
+    return errors
+
+
+def check_crf_models(app_configs, **kwargs):
+    """Checks that each CRF model has a visit foreign key and each
+    non-CRF model declares a registered Meta.visit_schedule_name.
+    """
+    from .model_mixins import OffstudyCrfModelMixin, OffstudyNonCrfModelMixin
+    errors = []
+    registry = site_visit_schedules.registry
+    for model_cls in django_apps.get_models():
+        if issubclass(model_cls, OffstudyCrfModelMixin) and not get_visit_field(model_cls):
+            errors.append(Error(
+                'Unable to determine the visit foreign key.',
+                hint='A CRF model requires a foreign key to the visit model.',
+                obj=model_cls,
+                id='edc_offstudy.E003'))
+        elif issubclass(model_cls, OffstudyNonCrfModelMixin):
+            visit_schedule_name = get_visit_schedule_name(model_cls)
+            if not visit_schedule_name:
+                errors.append(Error(
+                    'Unable to determine the visit schedule.',
+                    hint='Declare Meta.visit_schedule_name.',
+                    obj=model_cls,
+                    id='edc_offstudy.E004'))
+            elif registry and visit_schedule_name not in registry:
+                errors.append(Error(
+                    f'Unknown visit schedule. Got {visit_schedule_name}.',
+                    hint='Check Meta.visit_schedule_name.',
+                    obj=model_cls,
+                    id='edc_offstudy.E005'))
+    return errors
@@ -1,10 +1,15 @@
 from edc_visit_tracking.constants import COMPLETED_PROTOCOL_VISIT, LOST_VISIT
 from edc_constants.constants import DEAD
 
-from .constants import CONSENT_WITHDRAWAL
+from .constants import CONSENT_WITHDRAWAL, CREATED, UPDATED, DELETED
 
 OFF_STUDY_REASONS = (
     (LOST_VISIT, 'Lost to follow-up'),
     (COMPLETED_PROTOCOL_VISIT, 'Completed protocol'),
     (CONSENT_WITHDRAWAL, 'Completed protocol'),
     (DEAD, 'Deceased'))
+
+CHANGE_TYPES = (
+    (CREATED, 'Created'),
+    (UPDATED, 'Updated'),
+    (DELETED, 'Deleted'))
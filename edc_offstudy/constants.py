@@ -1,2 +1,6 @@
 
 CONSENT_WITHDRAWAL = 'consent_withdrawal'
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
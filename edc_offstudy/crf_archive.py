@@ -0,0 +1,194 @@
+from datetime import timedelta
+from django.apps import apps as django_apps
+from django.core import serializers
+from django.db import router, transaction
+from edc_base.utils import get_utcnow
+
+from .site_offstudy_models import site_offstudy_models
+from .utils import get_crf_models
+
+
+class CrfArchiveError(Exception):
+    pass
+
+
+class CrfArchive:
+
+    """Moves CRF and non-CRF rows of subjects off study for more
+    than `days` days out of their tables into ArchivedCrf.
+
+    Subjects are read in chunks of `chunk_size`. Rows are serialized
+    to JSON, one ArchivedCrf per row, and moved in one transaction
+    per `batch_size` rows. The rows are deleted without signals;
+    archiving is not a change to the CRF data.
+
+    Models referenced by other models, or with many-to-many fields,
+    are skipped since their rows cannot be removed on their own.
+
+    Read archived and hot rows together with `read`. Check an
+    archive with `verify`.
+    """
+
+    chunk_size = 500
+    batch_size = 500
+
+    def __init__(self, days=None, chunk_size=None, batch_size=None, dry_run=None):
+        if days is None:
+            days = getattr(django_apps.get_app_config('edc_offstudy'), 'archive_after_days', None)
+        self.days = days
+        self.chunk_size = chunk_size or self.chunk_size
+        self.batch_size = batch_size or self.batch_size
+        self.dry_run = dry_run
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(days={self.days}, dry_run={self.dry_run})'
+
+    @property
+    def archived_crf_model_cls(self):
+        return django_apps.get_model('edc_offstudy.archivedcrf')
+
+    @property
+    def cutoff_datetime(self):
+        if self.days is None or self.days < 0:
+            raise CrfArchiveError(
+                f'Expected days off study to be zero or more. Got {self.days}.')
+        return get_utcnow() - timedelta(days=self.days)
+
+    @staticmethod
+    def archivable(model_cls):
+        """Returns True if rows of model_cls can be removed on
+        their own.
+        """
+        return not (model_cls._meta.related_objects or model_cls._meta.many_to_many)
+
+    def get_models(self):
+        """Returns a list of (model_cls, subject_identifier lookup,
+        {visit_schedule_name lookup: value} or {}, off-study model_cls)
+        for each archivable CRF and non-CRF model.
+        """
+        models = []
+        for model_cls, subject_lookup, schedule_lookup in get_crf_models():
+            if not self.archivable(model_cls):
+                continue
+            if schedule_lookup:
+                for visit_schedule_name, offstudy_model_cls in (
+                        site_offstudy_models.visit_schedules.items()):
+                    models.append((model_cls, subject_lookup,
+                                   {schedule_lookup: visit_schedule_name},
+                                   offstudy_model_cls))
+            else:
+                offstudy_model_cls = site_offstudy_models.models.get(
+                    model_cls._meta.label_lower)
+                if offstudy_model_cls:
+                    models.append((model_cls, subject_lookup, {}, offstudy_model_cls))
+        return models
+
+    def get_subjects(self, offstudy_model_cls):
+        """Returns a dictionary of {subject_identifier: offstudy_datetime}
+        for subjects off study before the cutoff.
+        """
+        return dict(offstudy_model_cls.objects.filter(
+            offstudy_datetime__lt=self.cutoff_datetime).values_list(
+                'subject_identifier', 'offstudy_datetime'))
+
+    def archive(self):
+        """Archives and returns a dictionary of {label_lower: rows}.
+
+        If dry_run, nothing is written and the rows that would be
+        archived are counted.
+        """
+        counts = {}
+        subjects = {}
+        for model_cls, subject_lookup, schedule_options, offstudy_model_cls in self.get_models():
+            if offstudy_model_cls not in subjects:
+                subjects[offstudy_model_cls] = self.get_subjects(offstudy_model_cls)
+            offstudy_datetimes = subjects[offstudy_model_cls]
+            subject_identifiers = sorted(offstudy_datetimes)
+            for index in range(0, len(subject_identifiers), self.chunk_size):
+                queryset = model_cls.objects.filter(
+                    **{f'{subject_lookup}__in': subject_identifiers[index:index + self.chunk_size]},
+                    **schedule_options)
+                if self.dry_run:
+                    count = queryset.count()
+                else:
+                    count = self.archive_chunk(
+                        model_cls, queryset, subject_lookup, offstudy_datetimes)
+                if count:
+                    label_lower = model_cls._meta.label_lower
+                    counts[label_lower] = counts.get(label_lower, 0) + count
+        return counts
+
+    def archive_chunk(self, model_cls, queryset, subject_lookup, offstudy_datetimes):
+        """Moves the rows of queryset, one transaction per batch_size
+        rows, and returns the number of rows moved.
+        """
+        using = router.db_for_write(model_cls)
+        archived = 0
+        while True:
+            with transaction.atomic(using=using):
+                rows = dict(queryset.order_by('pk').values_list(
+                    'pk', subject_lookup)[:self.batch_size])
+                if not rows:
+                    break
+                objs = list(model_cls.objects.select_for_update().filter(pk__in=list(rows)))
+                self.archived_crf_model_cls.objects.bulk_create([
+                    self.archived_crf_model_cls(
+                        subject_identifier=rows[obj.pk],
+                        model=model_cls._meta.label_lower,
+                        object_pk=str(obj.pk),
+                        offstudy_datetime=offstudy_datetimes[rows[obj.pk]],
+                        serialized=serializers.serialize('json', [obj]))
+                    for obj in objs])
+                model_cls.objects.filter(pk__in=list(rows))._raw_delete(using)
+            archived += len(objs)
+        return archived
+
+    @staticmethod
+    def read(model_cls, subject_identifier):
+        """Returns a list of the subject's model_cls instances, saved
+        ones first, followed by unsaved instances from the archive.
+        """
+        for crf_model_cls, subject_lookup, _ in get_crf_models():
+            if crf_model_cls == model_cls:
+                break
+        else:
+            raise CrfArchiveError(
+                f'Not a CRF or non-CRF model. Got {model_cls._meta.label_lower}.')
+        archived_crf_model_cls = django_apps.get_model('edc_offstudy.archivedcrf')
+        objs = list(model_cls.objects.filter(**{subject_lookup: subject_identifier}))
+        objs.extend(archived_crf_model_cls.objects.get_objects(model_cls, subject_identifier))
+        return objs
+
+    def verify(self):
+        """Returns a list of problems found in the archive, if any.
+
+        Checks that each archived row deserializes to its model and
+        pk and that no archived row is also in its table.
+        """
+        problems = []
+        archived = self.archived_crf_model_cls.objects.order_by('id')
+        labels = self.archived_crf_model_cls.objects.order_by('model').values_list(
+            'model', flat=True).distinct()
+        for label_lower in labels:
+            try:
+                model_cls = django_apps.get_model(label_lower)
+            except LookupError:
+                problems.append(f'Unknown model. Got {label_lower}.')
+                continue
+            object_pks = {}
+            for obj in archived.filter(model=label_lower).iterator():
+                try:
+                    deserialized = [d.object for d in serializers.deserialize('json', obj.serialized)]
+                except serializers.base.DeserializationError as e:
+                    problems.append(f'Unable to deserialize {obj}. Got {e}.')
+                    continue
+                if len(deserialized) != 1 or str(deserialized[0].pk) != obj.object_pk:
+                    problems.append(f'Serialized data does not match {obj}.')
+                    continue
+                object_pks[deserialized[0].pk] = obj
+            pks = list(object_pks)
+            for index in range(0, len(pks), self.batch_size):
+                for pk in model_cls.objects.filter(
+                        pk__in=pks[index:index + self.batch_size]).values_list('pk', flat=True):
+                    problems.append(f'Archived row is also in its table. Got {object_pks[pk]}.')
+        return problems
@@ -0,0 +1,21 @@
+from django.utils import timezone
+
+
+class FormattedDatetime:
+
+    """Wraps a datetime and formats it in local time only when
+    rendered as a string.
+
+    Used as a message param on off-study errors so that raising
+    does not pay for `localtime` and `strftime`.
+    """
+
+    def __init__(self, value, date_format=None):
+        self.value = value
+        self.date_format = date_format
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.value}, {self.date_format})'
+
+    def __str__(self):
+        return timezone.localtime(self.value).strftime(self.date_format)
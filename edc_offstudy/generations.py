@@ -0,0 +1,120 @@
+import threading
+import time
+
+from functools import partial
+
+
+class Generations:
+
+    """A per-process counter of changes to off-study model instances.
+
+    Bumped when the transaction saving or deleting an off-study
+    model instance commits, see bump_on_commit. Callers holding
+    state derived from off-study data compare a previously read
+    generation with the current one to detect a change.
+
+    Until it commits, the change is only counted for the thread
+    that made it: `total` includes the thread's own uncommitted
+    changes, `committed_total` does not. See also `pending`.
+
+    Changes made by other processes are picked up by polling the
+    OffstudyGeneration table, at most once every
+    AppConfig.generation_poll_interval seconds (None, the default,
+    disables polling). See poll.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generations = {}
+        self._polled_generations = {}
+        self._polled = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+    def get(self, label_lower):
+        self.poll()
+        return self._generations.get(label_lower, 0)
+
+    @property
+    def total(self):
+        """Returns the sum of generations for all off-study models,
+        including this thread's uncommitted changes.
+        """
+        return self.committed_total + getattr(self._local, 'generation', 0)
+
+    @property
+    def committed_total(self):
+        """Returns the sum of generations for all off-study models.
+        """
+        self.poll()
+        return sum(self._generations.values())
+
+    @property
+    def pending(self):
+        """Returns True if this thread changed an off-study instance
+        in a transaction not yet committed.
+        """
+        from django.db import connection
+        if not connection.in_atomic_block:
+            self._local.pending = False
+        return getattr(self._local, 'pending', False)
+
+    def bump(self, label_lower):
+        with self._lock:
+            self._generations[label_lower] = self._generations.get(label_lower, 0) + 1
+
+    def bump_on_commit(self, label_lower):
+        """Counts a change for this thread now and for all threads
+        once the current transaction commits.
+
+        The thread's own count only ever increases so that a
+        rolled back change still counts as a change.
+        """
+        from django.db import transaction
+        self._local.generation = getattr(self._local, 'generation', 0) + 1
+        self._local.pending = True
+        transaction.on_commit(partial(self.committed, label_lower))
+
+    def committed(self, label_lower):
+        self._local.pending = False
+        self.bump(label_lower)
+
+    def reset(self):
+        with self._lock:
+            self._local = threading.local()
+            self._generations = {}
+            self._polled_generations = {}
+            self._polled = None
+
+    @property
+    def poll_interval(self):
+        from django.apps import apps as django_apps
+        return getattr(
+            django_apps.get_app_config('edc_offstudy'), 'generation_poll_interval', None)
+
+    def poll(self, force=None):
+        """Reads the OffstudyGeneration table, one query, if the poll
+        interval has passed and bumps the local generation of each
+        off-study model changed since the last poll.
+        """
+        poll_interval = self.poll_interval
+        if not force:
+            if poll_interval is None:
+                return
+            if self._polled and time.monotonic() - self._polled < poll_interval:
+                return
+        from django.apps import apps as django_apps
+        model_cls = django_apps.get_model('edc_offstudy.offstudygeneration')
+        self._polled = time.monotonic()
+        polled_generations = dict(
+            model_cls.objects.values_list('label_lower', 'generation'))
+        with self._lock:
+            for label_lower, generation in polled_generations.items():
+                if self._polled_generations.get(label_lower) != generation:
+                    self._generations[label_lower] = self._generations.get(label_lower, 0) + 1
+            self._polled_generations = polled_generations
+
+
+generations = Generations()
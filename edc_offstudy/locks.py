@@ -0,0 +1,106 @@
+import hashlib
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from django.apps import apps as django_apps
+from django.db import connection, transaction
+
+SELECT_FOR_UPDATE = 'select_for_update'
+ADVISORY = 'advisory'
+LOCK_MODES = [SELECT_FOR_UPDATE, ADVISORY]
+
+
+class SubjectLockError(Exception):
+    pass
+
+
+# seconds waited for each subject lock, most recent last
+lock_waits = deque(maxlen=10000)
+
+
+def get_lock_mode():
+    """Returns the lock mode set on the app config, if any.
+    """
+    mode = getattr(django_apps.get_app_config('edc_offstudy'), 'lock_mode', None)
+    if mode and mode not in LOCK_MODES:
+        raise SubjectLockError(
+            f'Invalid lock mode. Expected one of {LOCK_MODES}. Got {mode}.')
+    return mode
+
+
+def get_advisory_key(subject_identifier):
+    """Returns a signed 64-bit integer key for the subject.
+    """
+    digest = hashlib.md5(subject_identifier.encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+@contextmanager
+def subject_lock(subject_identifier, mode=None):
+    """A context manager that opens a transaction and, depending on
+    the lock mode, serializes off-study, CRF and non-CRF saves for
+    this subject only.
+
+    Modes:
+        * None: (Default) no lock, transaction only;
+        * SELECT_FOR_UPDATE: locks the subject's RegisteredSubject row;
+        * ADVISORY: takes an advisory lock keyed on subject_identifier
+          (PostgreSQL pg_advisory_xact_lock, MySQL GET_LOCK). On other
+          backends this is a no-op.
+
+    Set the mode on the app config, e.g. AppConfig.lock_mode. Time
+    spent waiting for the lock is appended to `lock_waits`.
+
+    MySQL's GET_LOCK is released on exit, so within an outer
+    transaction it would be released before the outer transaction
+    commits. In that case the SELECT_FOR_UPDATE mode is used instead
+    since the row lock is held until commit.
+    """
+    mode = mode or get_lock_mode()
+    if mode == ADVISORY and connection.vendor == 'mysql' and connection.in_atomic_block:
+        mode = SELECT_FOR_UPDATE
+    mysql_lock = mode == ADVISORY and connection.vendor == 'mysql'
+    if mysql_lock:
+        acquire_mysql_lock(subject_identifier)
+    try:
+        with transaction.atomic():
+            if mode == SELECT_FOR_UPDATE:
+                select_for_update(subject_identifier)
+            elif mode == ADVISORY and connection.vendor == 'postgresql':
+                acquire_postgresql_lock(subject_identifier)
+            yield
+    finally:
+        if mysql_lock:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT RELEASE_LOCK(%s)', [f'edc_offstudy.{subject_identifier}'])
+
+
+def select_for_update(subject_identifier):
+    model_cls = django_apps.get_model('edc_registration.registeredsubject')
+    started = time.monotonic()
+    list(model_cls.objects.select_for_update().filter(
+        subject_identifier=subject_identifier).values_list('pk', flat=True))
+    lock_waits.append(time.monotonic() - started)
+
+
+def acquire_postgresql_lock(subject_identifier):
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s)', [get_advisory_key(subject_identifier)])
+    lock_waits.append(time.monotonic() - started)
+
+
+def acquire_mysql_lock(subject_identifier, timeout=None):
+    started = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT GET_LOCK(%s, %s)',
+            [f'edc_offstudy.{subject_identifier}', timeout or 30])
+        acquired, = cursor.fetchone()
+    if not acquired:
+        raise SubjectLockError(
+            f'Unable to acquire lock for subject. Got {subject_identifier}.')
+    lock_waits.append(time.monotonic() - started)
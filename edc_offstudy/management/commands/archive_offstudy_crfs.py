@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...crf_archive import CrfArchive, CrfArchiveError
+
+
+class Command(BaseCommand):
+
+    help = ('Moves CRF and non-CRF data of subjects off study for more '
+            'than --days days into the ArchivedCrf table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Days off study. Defaults to AppConfig.archive_after_days.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Subjects per query.')
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Rows per transaction.')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Count the rows to archive only.')
+        parser.add_argument(
+            '--verify', action='store_true', default=False,
+            help='Verify the archive only.')
+
+    def handle(self, *args, **options):
+        crf_archive = CrfArchive(
+            days=options.get('days'),
+            chunk_size=options.get('chunk_size'),
+            batch_size=options.get('batch_size'),
+            dry_run=options.get('dry_run'))
+        if options.get('verify'):
+            problems = crf_archive.verify()
+            for problem in problems:
+                self.stdout.write(problem)
+            if problems:
+                raise CommandError(f'Archive verification failed. Got {len(problems)} problems.')
+            self.stdout.write('Archive verified.')
+            return
+        try:
+            counts = crf_archive.archive()
+        except CrfArchiveError as e:
+            raise CommandError(e)
+        self.stdout.write(json.dumps(dict(dry_run=crf_archive.dry_run, archived=counts)))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from ...purge_audit import AppointmentPurgeAudit
+
+
+class Command(BaseCommand):
+
+    help = ('Finds appointments on or after the off-study datetime '
+            'that should have been deleted. Use --fix to delete them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard-size', type=int, default=AppointmentPurgeAudit.shard_size,
+            help='Number of off-study subjects per shard.')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker threads.')
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='Path to a checkpoint file. Completed shards are skipped.')
+        parser.add_argument(
+            '--batch-size', type=int, default=AppointmentPurgeAudit.batch_size,
+            help='Number of appointments per delete transaction.')
+        parser.add_argument(
+            '--fix', action='store_true', default=False,
+            help='Delete the appointments found.')
+
+    def handle(self, *args, **options):
+        audit = AppointmentPurgeAudit(
+            shard_size=options.get('shard_size'),
+            workers=options.get('workers'),
+            checkpoint=options.get('checkpoint'),
+            batch_size=options.get('batch_size'),
+            fix=options.get('fix'))
+        checkpoint = audit.run()
+        self.stdout.write(
+            f'Audited {len(checkpoint["completed"])} shards. '
+            f'Found {checkpoint["found"]} appointments. '
+            f'Deleted {checkpoint["deleted"]}.')
@@ -0,0 +1,56 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ...offstudy_simulation import OffstudySimulation
+
+
+class Command(BaseCommand):
+
+    help = ('Reports, without writing anything, how many appointments '
+            'would be purged and how many CRFs would be reported after '
+            'the off-study date if subjects were taken off study.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='CSV file of subject_identifier,offstudy_datetime (ISO format).')
+        parser.add_argument(
+            '--visit-schedule', default=None,
+            help='Count only CRFs and non-CRFs of this visit schedule.')
+        parser.add_argument(
+            '--totals', action='store_true', default=False,
+            help='Print totals only.')
+
+    def handle(self, *args, **options):
+        simulation = OffstudySimulation(
+            offstudy_datetimes=self.read(options.get('path')),
+            visit_schedule_name=options.get('visit_schedule'))
+        results = simulation.run()
+        if not options.get('totals'):
+            for subject_identifier, counts in sorted(results.items()):
+                self.stdout.write(json.dumps(
+                    dict(subject_identifier=subject_identifier, **counts)))
+        self.stdout.write(json.dumps(dict(totals=simulation.totals(results))))
+
+    @staticmethod
+    def read(path):
+        offstudy_datetimes = []
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0] == 'subject_identifier':
+                    continue
+                try:
+                    subject_identifier, value = row[:2]
+                    offstudy_datetime = parse_datetime(value.strip())
+                except ValueError as e:
+                    raise CommandError(f'Invalid row. Got {row}. {e}')
+                if not offstudy_datetime:
+                    raise CommandError(f'Invalid offstudy_datetime. Got {row}.')
+                if timezone.is_naive(offstudy_datetime):
+                    offstudy_datetime = timezone.make_aware(offstudy_datetime)
+                offstudy_datetimes.append((subject_identifier.strip(), offstudy_datetime))
+        return offstudy_datetimes
@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import OffstudyEvent
+
+
+class Command(BaseCommand):
+
+    help = 'Writes off-study events after a cursor as JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cursor', type=int, default=0,
+            help='Sequence of the last event already read.')
+        parser.add_argument(
+            '--cursor-file', default=None,
+            help='Path to a file to read and save the cursor.')
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Number of events per read.')
+        parser.add_argument(
+            '--follow', action='store_true', default=False,
+            help='Keep reading new events.')
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait between reads if --follow.')
+
+    def handle(self, *args, **options):
+        cursor_file = options.get('cursor_file')
+        cursor = options.get('cursor')
+        if cursor_file:
+            try:
+                with open(cursor_file) as f:
+                    cursor = int(f.read().strip() or 0)
+            except FileNotFoundError:
+                pass
+        while True:
+            events, cursor = OffstudyEvent.objects.read(
+                cursor=cursor, limit=options.get('limit'))
+            for event in events:
+                self.stdout.write(json.dumps(event.to_dict()))
+            if events and cursor_file:
+                with open(cursor_file, 'w') as f:
+                    f.write(str(cursor))
+            if not options.get('follow'):
+                break
+            if len(events) < options.get('limit'):
+                time.sleep(options.get('interval'))
@@ -0,0 +1,14 @@
+from .subject_facts import subject_facts
+
+
+class SubjectFactsMiddleware:
+
+    """Scopes the per-subject fact cache to the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with subject_facts.scope():
+            return self.get_response(request)
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import edc_base.utils
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OffstudyEvent',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('subject_identifier', models.CharField(db_index=True, max_length=50)),
+                ('offstudy_model', models.CharField(max_length=100)),
+                ('visit_schedule_name', models.CharField(max_length=25, null=True)),
+                ('schedule_name', models.CharField(max_length=25, null=True)),
+                ('offstudy_datetime', models.DateTimeField(null=True)),
+                ('offstudy_reason', models.CharField(max_length=125, null=True)),
+                ('change_type', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=25)),
+                ('created', models.DateTimeField(default=edc_base.utils.get_utcnow)),
+            ],
+            options={
+                'verbose_name': 'Off-study event',
+                'ordering': ('sequence',),
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import edc_base.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_offstudy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgedAppointment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject_identifier', models.CharField(db_index=True, max_length=50)),
+                ('appointment_model', models.CharField(max_length=100)),
+                ('appt_datetime', models.DateTimeField()),
+                ('visit_schedule_name', models.CharField(max_length=25)),
+                ('schedule_name', models.CharField(max_length=25)),
+                ('visit_code', models.CharField(max_length=25)),
+                ('serialized', models.TextField()),
+                ('created', models.DateTimeField(default=edc_base.utils.get_utcnow)),
+            ],
+            options={
+                'verbose_name': 'Purged appointment',
+            },
+        ),
+    ]
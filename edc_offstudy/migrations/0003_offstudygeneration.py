@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import edc_base.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_offstudy', '0002_purgedappointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OffstudyGeneration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label_lower', models.CharField(max_length=100, unique=True)),
+                ('generation', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(default=edc_base.utils.get_utcnow)),
+            ],
+            options={
+                'verbose_name': 'Off-study generation',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import edc_base.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_offstudy', '0003_offstudygeneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCrf',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject_identifier', models.CharField(db_index=True, max_length=50)),
+                ('model', models.CharField(db_index=True, max_length=100)),
+                ('object_pk', models.CharField(max_length=50)),
+                ('offstudy_datetime', models.DateTimeField()),
+                ('serialized', models.TextField()),
+                ('archived', models.DateTimeField(default=edc_base.utils.get_utcnow)),
+            ],
+            options={
+                'verbose_name': 'Archived CRF',
+                'unique_together': {('model', 'object_pk')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_offstudy', '0004_archivedcrf'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='offstudyevent',
+            name='sequence',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,4 +1,8 @@
 from .offstudy_crf_model_mixin import OffstudyCrfModelMixin, OffstudyCrfModelMixinError
+from .offstudy_crf_model_mixin import OffstudyCrfManager, OffstudyCrfQuerySet
+from .offstudy_crf_model_mixin import RAISE, DROP, REPORT
 from .offstudy_model_mixin import OffstudyModelMixin, OffstudyModelManager
 from .offstudy_model_mixin import OffstudyModelMixinError
 from .offstudy_non_crf_model_mixin import OffstudyNonCrfModelMixin, OffstudyNonCrfModelMixinError
+from .offstudy_tracker_model_mixin import OffstudyTrackerModelMixin
+from .offstudy_visit_model_mixin import OffstudyVisitModelMixin
@@ -1,14 +1,95 @@
-from django.apps import apps as django_apps
 from django.db import models
 
+from ..generations import generations
+from ..locks import subject_lock
 from ..offstudy_crf import OffstudyCrf
+from ..offstudy_crf_batch import OffstudyCrfBatch
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models
+from .offstudy_tracker_model_mixin import OffstudyTrackerModelMixin
+
+RAISE = 'raise'
+DROP = 'drop'
+REPORT = 'report'
 
 
 class OffstudyCrfModelMixinError(Exception):
     pass
 
 
-class OffstudyCrfModelMixin(models.Model):
+class OffstudyCrfQuerySet(models.QuerySet):
+
+    """A QuerySet whose bulk_create and bulk_update validate the
+    objs against off-study datetimes.
+
+    The `offstudy_policy` decides what happens to violators:
+        * RAISE: (Default) raise the first SubjectOffstudyError;
+        * DROP: write all objs except the violators;
+        * REPORT: as DROP but returns the list of violations
+          as (obj, SubjectOffstudyError) instead of the objs
+          written. Violators are NOT written.
+    """
+
+    offstudy_batch_cls = OffstudyCrfBatch
+    offstudy_policy = RAISE
+
+    def offstudy_violations(self, objs, batch_size=None):
+        """Returns a list of (obj, SubjectOffstudyError).
+        """
+        return self.offstudy_batch_cls(
+            model_cls=self.model, objs=objs, chunk_size=batch_size).violations
+
+    def bulk_create(self, objs, batch_size=None, offstudy_policy=None, **kwargs):
+        """Inserts objs except violators, unless RAISE. Returns the
+        objs inserted or, if REPORT, the violations.
+        """
+        objs, violations = self.offstudy_validate(
+            objs, batch_size=batch_size, offstudy_policy=offstudy_policy)
+        created = super().bulk_create(objs, batch_size=batch_size, **kwargs)
+        if (offstudy_policy or self.offstudy_policy) == REPORT:
+            return violations
+        return created
+
+    def bulk_update(self, objs, fields, batch_size=None, offstudy_policy=None):
+        """Updates objs except violators, unless RAISE. Returns as
+        Django's bulk_update or, if REPORT, the violations.
+        """
+        tracked = self.model.offstudy_tracked_attnames()
+        violations = []
+        if [f for f in fields if self.model._meta.get_field(f).attname in tracked]:
+            objs, violations = self.offstudy_validate(
+                objs, batch_size=batch_size, offstudy_policy=offstudy_policy)
+        updated = super().bulk_update(objs, fields, batch_size=batch_size)
+        if (offstudy_policy or self.offstudy_policy) == REPORT:
+            return violations
+        return updated
+
+    def offstudy_validate(self, objs, batch_size=None, offstudy_policy=None):
+        """Returns a tuple of (objs without violators, violations)
+        or raises on the first violation.
+        """
+        offstudy_policy = offstudy_policy or self.offstudy_policy
+        if offstudy_policy not in [RAISE, DROP, REPORT]:
+            raise OffstudyCrfModelMixinError(
+                f'Invalid offstudy_policy. Got {offstudy_policy}.')
+        objs = list(objs)
+        violations = self.offstudy_violations(objs, batch_size=batch_size)
+        if violations and offstudy_policy == RAISE:
+            raise violations[0][1]
+        violators = {id(obj) for obj, _ in violations}
+        return [obj for obj in objs if id(obj) not in violators], violations
+
+
+class OffstudyCrfManager(models.Manager.from_queryset(OffstudyCrfQuerySet)):
+
+    """A manager for CRF models whose bulk operations check
+    off-study datetimes. See OffstudyCrfQuerySet.
+    """
+
+    pass
+
+
+class OffstudyCrfModelMixin(OffstudyTrackerModelMixin, models.Model):
 
     """A mixin for CRF models to add the ability to determine
     if the subject is off study as of this CRFs report_datetime.
@@ -17,6 +98,12 @@ class OffstudyCrfModelMixin(models.Model):
     See edc_visit_tracking.
 
     Also requires field "report_datetime"
+
+    The off-study check is skipped on save if neither the visit nor
+    the report_datetime changed since load. See OffstudyTrackerModelMixin.
+
+    The check and save are done under the subject's lock, see
+    subject_lock.
     """
 
     offstudy_cls = OffstudyCrf
@@ -26,21 +113,34 @@ class OffstudyCrfModelMixin(models.Model):
     # offstudy_datetime as dates
     offstudy_compare_dates_as_datetimes = False
 
+    @profiled('offstudy_crf_save')
     def save(self, *args, **kwargs):
+        generation = generations.total
+        if self.offstudy_check_required():
+            with subject_lock(self.offstudy_visit().subject_identifier):
+                self.offstudy_check()
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self.offstudy_tracker_reset(generation=generation)
+
+    def offstudy_visit(self):
         try:
-            offstudy_model = self.visit.visit_schedule.offstudy_model
+            return self.visit
         except AttributeError as e:
             if 'visit' in str(e):
                 raise OffstudyCrfModelMixinError(
                     f'Model requires property \'visit\'. See {repr(self)}, Got {e}.')
             raise
-        offstudy_model_cls = django_apps.get_model(offstudy_model)
+
+    def offstudy_check(self):
+        visit = self.offstudy_visit()
         self.offstudy_cls(
-            subject_identifier=self.visit.subject_identifier,
-            offstudy_model_cls=offstudy_model_cls,
+            subject_identifier=visit.subject_identifier,
+            offstudy_model_cls=site_offstudy_models.get_by_visit_schedule(
+                visit.visit_schedule_name),
             compare_as_datetimes=self.offstudy_compare_dates_as_datetimes,
             **self.__dict__)
-        super().save(*args, **kwargs)
 
     class Meta:
         abstract = True
@@ -12,7 +12,12 @@ from edc_visit_schedule.model_mixins import VisitScheduleMethodsModelMixin
 from edc_visit_schedule.model_mixins import VisitScheduleFieldsModelMixin
 
 from ..choices import OFF_STUDY_REASONS
+from ..constants import CREATED, UPDATED
+from ..generations import generations
+from ..locks import subject_lock
 from ..offstudy import Offstudy
+from ..profiling import profiled
+from ..utils import get_soft_purge
 
 if 'consent_model' not in options.DEFAULT_NAMES:
     options.DEFAULT_NAMES = options.DEFAULT_NAMES + ('consent_model',)
@@ -36,6 +41,12 @@ class OffstudyModelMixin(UniqueSubjectIdentifierFieldMixin,
                          VisitScheduleMethodsModelMixin, models.Model):
     """Model mixin for the Off-study model.
 
+    Validation, the purge of appointments, the save, the
+    OffstudyEvent and the OffstudyGeneration bump are done in one
+    transaction under the subject's lock, see subject_lock. On
+    delete, the latter two are done by the post_delete receiver,
+    see signals.
+
     Override in admin like this:
 
         def formfield_for_choice_field(self, db_field, request, **kwargs):
@@ -65,6 +76,7 @@ class OffstudyModelMixin(UniqueSubjectIdentifierFieldMixin,
 
     objects = OffstudyModelManager()
 
+    @profiled('offstudy_model_save')
     def save(self, *args, **kwargs):
         try:
             consent_model = self._meta.consent_model
@@ -78,12 +90,75 @@ class OffstudyModelMixin(UniqueSubjectIdentifierFieldMixin,
                 raise OffstudyModelMixinError(
                     f'Invalid consent model. See Meta options '
                     f'for {repr(self)}. Got {e}.')
-        self.offstudy_cls(
-            consent_model_cls=consent_model_cls,
-            label_lower=self._meta.label_lower,
-            visit_model_app_label=self.offstudy_visit_model_app_label,
-            **self.__dict__)
-        super().save(*args, **kwargs)
+        change_type = CREATED if self._state.adding else UPDATED
+        with subject_lock(self.subject_identifier):
+            self.offstudy_cls(
+                consent_model_cls=consent_model_cls,
+                label_lower=self._meta.label_lower,
+                visit_model_app_label=self.offstudy_visit_model_app_label,
+                **self.__dict__)
+            super().save(*args, **kwargs)
+            if change_type == CREATED or self.offstudy_event_required():
+                self.offstudy_event_model_cls.objects.create_for(self, change_type)
+            self.offstudy_generation_model_cls.objects.bump(self._meta.label_lower)
+        self.offstudy_loaded = self.offstudy_schedule_values()
+        self.offstudy_reason_loaded = self.__dict__.get('offstudy_reason')
+        generations.bump_on_commit(self._meta.label_lower)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.offstudy_loaded = instance.offstudy_schedule_values()
+        instance.offstudy_reason_loaded = instance.__dict__.get('offstudy_reason')
+        return instance
+
+    def offstudy_schedule_values(self):
+        return (self.__dict__.get('offstudy_datetime'),
+                self.__dict__.get('visit_schedule_name'),
+                self.__dict__.get('schedule_name'))
+
+    def offstudy_event_required(self):
+        """Returns True if an UPDATED OffstudyEvent is required, that
+        is, if a value carried by the event changed since load or
+        the loaded values are unknown.
+        """
+        loaded = getattr(self, 'offstudy_loaded', None)
+        if not loaded or None in loaded or not hasattr(self, 'offstudy_reason_loaded'):
+            return True
+        return (loaded, self.offstudy_reason_loaded) != (
+            self.offstudy_schedule_values(), self.offstudy_reason)
+
+    def offstudy_refresh_required(self):
+        """Returns True if the enrolled schedule must be refreshed
+        after an update.
+
+        Moving offstudy_datetime earlier (or not at all) needs no
+        refresh since Offstudy already deleted the appointments
+        on or after the new date. Moving it later does, unless in
+        soft-purge mode where Offstudy restores them. Changing the
+        schedule or not knowing the loaded values always does.
+        """
+        loaded = getattr(self, 'offstudy_loaded', None)
+        if not loaded or None in loaded:
+            return True
+        offstudy_datetime, visit_schedule_name, schedule_name = loaded
+        if (visit_schedule_name, schedule_name) != (
+                self.visit_schedule_name, self.schedule_name):
+            return True
+        return self.offstudy_datetime > offstudy_datetime and not get_soft_purge()
+
+    @profiled('offstudy_model_delete')
+    def delete(self, *args, **kwargs):
+        with subject_lock(self.subject_identifier):
+            return super().delete(*args, **kwargs)
+
+    @property
+    def offstudy_event_model_cls(self):
+        return django_apps.get_model('edc_offstudy.offstudyevent')
+
+    @property
+    def offstudy_generation_model_cls(self):
+        return django_apps.get_model('edc_offstudy.offstudygeneration')
 
     def natural_key(self):
         return (self.subject_identifier, )
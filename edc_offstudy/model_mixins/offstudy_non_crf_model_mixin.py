@@ -1,21 +1,31 @@
-from django.apps import apps as django_apps
 from django.db import models
 from edc_visit_schedule.model_mixins import VisitScheduleMethodsModelMixin
 
+from ..generations import generations
+from ..locks import subject_lock
 from ..offstudy_non_crf import OffstudyNonCrf
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models, SiteOffstudyModelsError
+from .offstudy_tracker_model_mixin import OffstudyTrackerModelMixin
 
 
 class OffstudyNonCrfModelMixinError(Exception):
     pass
 
 
-class OffstudyNonCrfModelMixin(VisitScheduleMethodsModelMixin, models.Model):
+class OffstudyNonCrfModelMixin(OffstudyTrackerModelMixin,
+                               VisitScheduleMethodsModelMixin, models.Model):
 
     """A mixin for non-CRF models to add the ability to determine
     if the subject is off study as of this non-CRFs report_datetime.
 
     Requires fields "subject_identifier" and "report_datetime"
 
+    The off-study check is skipped on save if neither field changed
+    since load. See OffstudyTrackerModelMixin.
+
+    The check and save are done under the subject's lock, see
+    subject_lock.
     """
 
     offstudy_cls = OffstudyNonCrf
@@ -25,19 +35,29 @@ class OffstudyNonCrfModelMixin(VisitScheduleMethodsModelMixin, models.Model):
     # offstudy_datetime as dates
     offstudy_compare_dates_as_datetimes = False
 
+    @profiled('offstudy_non_crf_save')
     def save(self, *args, **kwargs):
+        generation = generations.total
+        if self.offstudy_check_required():
+            with subject_lock(self.subject_identifier):
+                self.offstudy_check()
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self.offstudy_tracker_reset(generation=generation)
+
+    def offstudy_check(self):
         try:
-            offstudy_model = self.visit_schedule.offstudy_model
-        except AttributeError:
+            offstudy_model_cls = site_offstudy_models.get_by_model(
+                self._meta.label_lower)
+        except SiteOffstudyModelsError as e:
             raise OffstudyNonCrfModelMixinError(
                 f'Unable to determine offstudy model. Non-CRF model '
-                f'requires method \'visit_schedule\'. See {repr(self)}.')
-        offstudy_model_cls = django_apps.get_model(offstudy_model)
+                f'requires Meta.visit_schedule_name. See {repr(self)}. Got {e}')
         self.offstudy_cls(
             offstudy_model_cls=offstudy_model_cls,
             compare_as_datetimes=self.offstudy_compare_dates_as_datetimes,
             **self.__dict__)
-        super().save(*args, **kwargs)
 
     @property
     def visit(self):
@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import DEFERRED
+
+from ..generations import generations
+
+
+class OffstudyTrackerModelMixin(models.Model):
+
+    """A mixin that remembers the values the off-study check depends
+    on as loaded from the DB.
+
+    The off-study check may be skipped on save if "report_datetime",
+    "subject_identifier" and the foreign keys (e.g. the visit) are
+    unchanged and no off-study instance changed since load.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.offstudy_tracker_reset()
+        return instance
+
+    @classmethod
+    def offstudy_tracked_attnames(cls):
+        attnames = []
+        for field in cls._meta.concrete_fields:
+            if field.is_relation:
+                attnames.append(field.attname)
+            elif field.name in ['report_datetime', 'subject_identifier']:
+                attnames.append(field.attname)
+        return attnames
+
+    def offstudy_tracked_values(self):
+        return tuple(
+            self.__dict__.get(attname, DEFERRED)
+            for attname in self.offstudy_tracked_attnames())
+
+    def offstudy_tracker_reset(self, generation=None):
+        """Stores the current values as the "loaded" values.
+        """
+        self._offstudy_loaded_values = self.offstudy_tracked_values()
+        self._offstudy_loaded_generation = (
+            generations.total if generation is None else generation)
+
+    def offstudy_check_required(self):
+        """Returns True if the off-study check cannot be skipped.
+        """
+        loaded_values = getattr(self, '_offstudy_loaded_values', None)
+        if self._state.adding or loaded_values is None or DEFERRED in loaded_values:
+            return True
+        if generations.total != self._offstudy_loaded_generation:
+            return True
+        return self.offstudy_tracked_values() != loaded_values
+
+    class Meta:
+        abstract = True
@@ -0,0 +1,50 @@
+from django.db import models
+
+from ..generations import generations
+from ..locks import subject_lock
+from ..offstudy_crf import OffstudyCrf
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models
+from .offstudy_tracker_model_mixin import OffstudyTrackerModelMixin
+
+
+class OffstudyVisitModelMixin(OffstudyTrackerModelMixin, models.Model):
+
+    """A mixin for visit models to add the ability to determine
+    if the subject is off study as of the visit's report_datetime.
+
+    Declare with VisitModelMixin. See edc_visit_tracking.
+
+    Uses the same off-study model map and subject_facts cache as
+    the CRF mixin, so a visit and its CRFs saved in one scope read
+    the off-study row once.
+    """
+
+    offstudy_cls = OffstudyCrf
+
+    # If True, compares report_datetime and offstudy_datetime as datetimes
+    # If False, (Default) compares report_datetime and
+    # offstudy_datetime as dates
+    offstudy_compare_dates_as_datetimes = False
+
+    @profiled('offstudy_visit_save')
+    def save(self, *args, **kwargs):
+        generation = generations.total
+        if self.offstudy_check_required():
+            with subject_lock(self.subject_identifier):
+                self.offstudy_check()
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self.offstudy_tracker_reset(generation=generation)
+
+    def offstudy_check(self):
+        self.offstudy_cls(
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.report_datetime,
+            offstudy_model_cls=site_offstudy_models.get_by_visit_schedule(
+                self.visit_schedule_name),
+            compare_as_datetimes=self.offstudy_compare_dates_as_datetimes)
+
+    class Meta:
+        abstract = True
@@ -1,3 +1,5 @@
 from .offstudy_modelform_mixins import OffstudyModelFormMixin
 from .offstudy_crf_modelform_mixin import OffstudyCrfModelFormMixin
 from .offstudy_non_crf_modelform_mixin import OffstudyNonCrfModelFormMixin
+from .offstudy_formset_mixin import OffstudyFormSetMixin
+from .offstudy_visit_modelform_mixin import OffstudyVisitModelFormMixin
@@ -1,6 +1,8 @@
 from django import forms
 
 from ..offstudy_crf import OffstudyCrf, SubjectOffstudyError
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models
 
 
 class OffstudyCrfModelFormMixin(forms.ModelForm):
@@ -10,15 +12,37 @@ class OffstudyCrfModelFormMixin(forms.ModelForm):
 
     offstudy_cls = OffstudyCrf
 
+    def __init__(self, *args, defer_offstudy_check=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # if True, the check is left to the formset, see OffstudyFormSetMixin
+        self.defer_offstudy_check = defer_offstudy_check
+
+    @profiled('offstudy_crf_form_clean')
     def clean(self):
         cleaned_data = super().clean()
-        subject_visit = cleaned_data.get('subject_visit')
-        offstudy_model = subject_visit.visit_schedule.offstudy_model
-        try:
-            self.offstudy_cls(
-                subject_identifier=subject_visit.subject_identifier,
-                offstudy_model=offstudy_model,
-                **cleaned_data)
-        except SubjectOffstudyError as e:
-            raise forms.ValidationError({'report_datetime': e})
+        query = None if self.defer_offstudy_check else self.offstudy_query(cleaned_data)
+        if query:
+            subject_identifier, _, offstudy_model_cls = query
+            try:
+                self.offstudy_cls(
+                    subject_identifier=subject_identifier,
+                    offstudy_model_cls=offstudy_model_cls,
+                    **cleaned_data)
+            except SubjectOffstudyError as e:
+                raise forms.ValidationError({
+                    'report_datetime': forms.ValidationError(
+                        e.message, code=e.code, params=e.params)})
         return cleaned_data
+
+    def offstudy_query(self, cleaned_data):
+        """Returns a tuple of (subject_identifier, report_datetime,
+        offstudy_model_cls) or None if the visit or report_datetime
+        is missing, e.g. if invalid.
+        """
+        subject_visit = cleaned_data.get('subject_visit')
+        report_datetime = cleaned_data.get('report_datetime')
+        if not subject_visit or not report_datetime:
+            return None
+        return (subject_visit.subject_identifier, report_datetime,
+                site_offstudy_models.get_by_visit_schedule(
+                    subject_visit.visit_schedule_name))
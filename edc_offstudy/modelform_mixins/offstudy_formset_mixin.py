@@ -0,0 +1,62 @@
+from django import forms
+
+from ..offstudy_crf import is_offstudy, subject_offstudy_error
+from ..site_offstudy_models import SiteOffstudyModelsError
+
+
+class OffstudyFormSetMixin:
+
+    """A formset mixin for forms declared with OffstudyCrfModelFormMixin
+    or OffstudyNonCrfModelFormMixin, e.g. admin inlines.
+
+    Instead of one off-study query per form, the forms defer the
+    check and the formset reads the off-study datetimes of all its
+    subjects with one query per off-study model. Errors are added
+    to each form's "report_datetime" as the form mixins do. Forms
+    whose off-study model cannot be determined raise a non-form
+    error.
+
+    Forms without a subject or report_datetime, see each form's
+    offstudy_query, are not checked; they have field errors.
+    """
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs.update(defer_offstudy_check=True)
+        return kwargs
+
+    def clean(self):
+        super().clean()
+        queries = {}
+        errors = []
+        for form in self.forms:
+            cleaned_data = getattr(form, 'cleaned_data', None)
+            if not cleaned_data or self._should_delete_form(form):
+                continue
+            try:
+                query = form.offstudy_query(cleaned_data)
+            except SiteOffstudyModelsError as e:
+                errors.append(forms.ValidationError(
+                    f'Unable to check the off-study status. {e}',
+                    code='offstudy_model'))
+                continue
+            if query:
+                subject_identifier, report_datetime, offstudy_model_cls = query
+                queries.setdefault(offstudy_model_cls, []).append(
+                    (form, subject_identifier, report_datetime))
+        for offstudy_model_cls, items in queries.items():
+            offstudy_datetimes = dict(offstudy_model_cls.objects.filter(
+                subject_identifier__in={item[1] for item in items}).values_list(
+                    'subject_identifier', 'offstudy_datetime'))
+            for form, subject_identifier, report_datetime in items:
+                offstudy_datetime = offstudy_datetimes.get(subject_identifier)
+                if is_offstudy(offstudy_datetime=offstudy_datetime,
+                               report_datetime=report_datetime):
+                    e = subject_offstudy_error(
+                        subject_identifier=subject_identifier,
+                        offstudy_datetime=offstudy_datetime,
+                        report_datetime=report_datetime)
+                    form.add_error('report_datetime', forms.ValidationError(
+                        e.message, code=e.code, params=e.params))
+        if errors:
+            raise forms.ValidationError(errors)
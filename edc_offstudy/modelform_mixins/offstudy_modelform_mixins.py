@@ -1,7 +1,7 @@
 from django import forms
 
 from ..offstudy import Offstudy, OffstudyError
-from pprint import pprint
+from ..profiling import profiled
 
 
 class OffstudyModelFormMixin(forms.ModelForm):
@@ -11,6 +11,7 @@ class OffstudyModelFormMixin(forms.ModelForm):
 
     offstudy_cls = Offstudy
 
+    @profiled('offstudy_form_clean')
     def clean(self):
         cleaned_data = super().clean()
         consent_model = self._meta.model._meta.consent_model
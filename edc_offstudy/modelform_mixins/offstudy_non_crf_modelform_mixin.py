@@ -2,6 +2,8 @@ from django import forms
 
 from ..offstudy_crf import SubjectOffstudyError
 from ..offstudy_non_crf import OffstudyNonCrf
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models
 
 
 class OffstudyNonCrfModelFormMixin(forms.ModelForm):
@@ -11,11 +13,33 @@ class OffstudyNonCrfModelFormMixin(forms.ModelForm):
 
     offstudy_cls = OffstudyNonCrf
 
+    def __init__(self, *args, defer_offstudy_check=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # if True, the check is left to the formset, see OffstudyFormSetMixin
+        self.defer_offstudy_check = defer_offstudy_check
+
+    @profiled('offstudy_non_crf_form_clean')
     def clean(self):
         cleaned_data = super().clean()
-        offstudy_model = self._meta.model().visit_schedule.offstudy_model
-        try:
-            self.offstudy_cls(offstudy_model=offstudy_model, **cleaned_data)
-        except SubjectOffstudyError as e:
-            raise forms.ValidationError({'report_datetime': e})
+        query = None if self.defer_offstudy_check else self.offstudy_query(cleaned_data)
+        if query:
+            _, _, offstudy_model_cls = query
+            try:
+                self.offstudy_cls(offstudy_model_cls=offstudy_model_cls, **cleaned_data)
+            except SubjectOffstudyError as e:
+                raise forms.ValidationError({
+                    'report_datetime': forms.ValidationError(
+                        e.message, code=e.code, params=e.params)})
         return cleaned_data
+
+    def offstudy_query(self, cleaned_data):
+        """Returns a tuple of (subject_identifier, report_datetime,
+        offstudy_model_cls) or None if either value is missing, e.g.
+        if invalid.
+        """
+        subject_identifier = cleaned_data.get('subject_identifier')
+        report_datetime = cleaned_data.get('report_datetime')
+        if not subject_identifier or not report_datetime:
+            return None
+        return (subject_identifier, report_datetime,
+                site_offstudy_models.get_by_model(self._meta.model._meta.label_lower))
@@ -0,0 +1,50 @@
+from django import forms
+
+from ..offstudy_crf import OffstudyCrf, SubjectOffstudyError
+from ..profiling import profiled
+from ..site_offstudy_models import site_offstudy_models
+
+
+class OffstudyVisitModelFormMixin(forms.ModelForm):
+
+    """ModelForm mixin for visit models.
+    """
+
+    offstudy_cls = OffstudyCrf
+
+    def __init__(self, *args, defer_offstudy_check=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # if True, the check is left to the formset, see OffstudyFormSetMixin
+        self.defer_offstudy_check = defer_offstudy_check
+
+    @profiled('offstudy_visit_form_clean')
+    def clean(self):
+        cleaned_data = super().clean()
+        query = None if self.defer_offstudy_check else self.offstudy_query(cleaned_data)
+        if query:
+            subject_identifier, report_datetime, offstudy_model_cls = query
+            try:
+                self.offstudy_cls(
+                    subject_identifier=subject_identifier,
+                    report_datetime=report_datetime,
+                    offstudy_model_cls=offstudy_model_cls)
+            except SubjectOffstudyError as e:
+                raise forms.ValidationError({
+                    'report_datetime': forms.ValidationError(
+                        e.message, code=e.code, params=e.params)})
+        return cleaned_data
+
+    def offstudy_query(self, cleaned_data):
+        """Returns a tuple of (subject_identifier, report_datetime,
+        offstudy_model_cls) or None if the appointment or
+        report_datetime is missing, e.g. if invalid.
+        """
+        appointment = cleaned_data.get('appointment')
+        if not appointment and self.instance.appointment_id:
+            appointment = self.instance.appointment
+        report_datetime = cleaned_data.get('report_datetime')
+        if not appointment or not report_datetime:
+            return None
+        return (appointment.subject_identifier, report_datetime,
+                site_offstudy_models.get_by_visit_schedule(
+                    appointment.visit_schedule_name))
@@ -1,4 +1,285 @@
+from django.apps import apps as django_apps
 from django.conf import settings
+from django.core import serializers
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Max
+from edc_base.utils import get_utcnow
 
-if settings.APP_NAME == 'edc_offstudy':
+from .choices import CHANGE_TYPES
+
+
+class OffstudyEventManager(models.Manager):
+
+    def create_for(self, instance, change_type):
+        """Appends an event for an off-study model instance.
+        """
+        with transaction.atomic():
+            return self.create(
+                sequence=self.next_sequence(),
+                subject_identifier=instance.subject_identifier,
+                offstudy_model=instance._meta.label_lower,
+                visit_schedule_name=instance.visit_schedule_name,
+                schedule_name=instance.schedule_name,
+                offstudy_datetime=instance.offstudy_datetime,
+                offstudy_reason=instance.offstudy_reason,
+                change_type=change_type)
+
+    def next_sequence(self):
+        """Returns the next sequence from a counter row, see
+        OffstudyGeneration, locked until the caller's transaction
+        ends.
+
+        Since the lock is held until commit, sequences are visible
+        to readers in the order they are given out.
+        """
+        generation_model_cls = django_apps.get_model('edc_offstudy.offstudygeneration')
+        return generation_model_cls.objects.bump(
+            self.model._meta.label_lower,
+            initial=(self.aggregate(sequence=Max('sequence')).get('sequence') or 0) + 1)
+
+    def read(self, cursor=None, limit=None):
+        """Returns a tuple of (events, next cursor) for events
+        after `cursor`, oldest first.
+        """
+        cursor = cursor or 0
+        events = list(self.filter(sequence__gt=cursor).order_by('sequence')[:limit or 100])
+        if events:
+            cursor = events[-1].sequence
+        return events, cursor
+
+
+class OffstudyEvent(models.Model):
+
+    """An outbox of changes to off-study model instances.
+
+    Appended in the same transaction as the save or delete of the
+    off-study model instance, see OffstudyModelMixin. Consumers read
+    incrementally by `sequence`, see OffstudyEventManager.read and
+    the "tail_offstudy_events" management command.
+
+    The sequence is given out in commit order, see
+    OffstudyEventManager.next_sequence, so a reader never misses an
+    event committed after a higher sequence was read.
+    """
+
+    sequence = models.BigIntegerField(primary_key=True)
+
+    subject_identifier = models.CharField(max_length=50, db_index=True)
+
+    offstudy_model = models.CharField(max_length=100)
+
+    visit_schedule_name = models.CharField(max_length=25, null=True)
+
+    schedule_name = models.CharField(max_length=25, null=True)
+
+    offstudy_datetime = models.DateTimeField(null=True)
+
+    offstudy_reason = models.CharField(max_length=125, null=True)
+
+    change_type = models.CharField(max_length=25, choices=CHANGE_TYPES)
+
+    created = models.DateTimeField(default=get_utcnow)
+
+    objects = OffstudyEventManager()
+
+    def __str__(self):
+        return f'{self.sequence} {self.subject_identifier} {self.change_type}'
+
+    def to_dict(self):
+        return dict(
+            sequence=self.sequence,
+            subject_identifier=self.subject_identifier,
+            offstudy_model=self.offstudy_model,
+            visit_schedule_name=self.visit_schedule_name,
+            schedule_name=self.schedule_name,
+            offstudy_datetime=(
+                self.offstudy_datetime.isoformat() if self.offstudy_datetime else None),
+            offstudy_reason=self.offstudy_reason,
+            change_type=self.change_type,
+            created=self.created.isoformat())
+
+    class Meta:
+        ordering = ('sequence', )
+        verbose_name = 'Off-study event'
+
+
+class PurgedAppointmentManager(models.Manager):
+
+    def purge(self, appointment_model_cls, subject_identifier, purge_datetime):
+        """Deletes the subject's appointments on or after
+        `purge_datetime` as delete_for_subject_after_date does, keeping
+        a serialized copy of each deleted row. Returns the number purged.
+        """
+        appointments = {obj.pk: obj for obj in appointment_model_cls.objects.filter(
+            subject_identifier=subject_identifier)}
+        appointment_model_cls.objects.delete_for_subject_after_date(
+            subject_identifier, purge_datetime)
+        remaining = set(appointment_model_cls.objects.filter(
+            subject_identifier=subject_identifier).values_list('pk', flat=True))
+        purged = [obj for pk, obj in appointments.items() if pk not in remaining]
+        self.bulk_create([self.model(
+            subject_identifier=subject_identifier,
+            appointment_model=obj._meta.label_lower,
+            appt_datetime=obj.appt_datetime,
+            visit_schedule_name=obj.visit_schedule_name,
+            schedule_name=obj.schedule_name,
+            visit_code=obj.visit_code,
+            serialized=serializers.serialize('json', [obj])) for obj in purged])
+        return len(purged)
+
+    def restore(self, subject_identifier, before_datetime=None):
+        """Restores the subject's purged appointments, or only those
+        before `before_datetime`, with one bulk_create per appointment
+        model. Returns the number restored.
+
+        Rows whose visit is already scheduled again are discarded.
+        """
+        purged = self.filter(subject_identifier=subject_identifier)
+        if before_datetime:
+            purged = purged.filter(appt_datetime__lt=before_datetime)
+        purged = list(purged)
+        restored = 0
+        for label_lower in {obj.appointment_model for obj in purged}:
+            model_cls = django_apps.get_model(label_lower)
+            existing = set(model_cls.objects.filter(
+                subject_identifier=subject_identifier).values_list(
+                    'visit_schedule_name', 'schedule_name', 'visit_code'))
+            objs = [
+                deserialized.object
+                for obj in purged if obj.appointment_model == label_lower and (
+                    obj.visit_schedule_name, obj.schedule_name, obj.visit_code) not in existing
+                for deserialized in serializers.deserialize('json', obj.serialized)]
+            model_cls.objects.bulk_create(objs)
+            restored += len(objs)
+        self.filter(pk__in=[obj.pk for obj in purged]).delete()
+        return restored
+
+
+class PurgedAppointment(models.Model):
+
+    """A copy of an appointment deleted by Offstudy in soft-purge
+    mode, see AppConfig.soft_purge.
+
+    Restored in bulk if the off-study instance is deleted or its
+    offstudy_datetime moves later, see PurgedAppointmentManager.
+    """
+
+    subject_identifier = models.CharField(max_length=50, db_index=True)
+
+    appointment_model = models.CharField(max_length=100)
+
+    appt_datetime = models.DateTimeField()
+
+    visit_schedule_name = models.CharField(max_length=25)
+
+    schedule_name = models.CharField(max_length=25)
+
+    visit_code = models.CharField(max_length=25)
+
+    serialized = models.TextField()
+
+    created = models.DateTimeField(default=get_utcnow)
+
+    objects = PurgedAppointmentManager()
+
+    def __str__(self):
+        return f'{self.subject_identifier} {self.visit_code}'
+
+    class Meta:
+        verbose_name = 'Purged appointment'
+
+
+class OffstudyGenerationManager(models.Manager):
+
+    def bump(self, label_lower, initial=None):
+        """Increments the generation of the off-study model, in the
+        caller's transaction, and returns it.
+
+        The row stays locked until the caller's transaction ends.
+        """
+        options = dict(generation=F('generation') + 1, modified=get_utcnow())
+        if not self.filter(label_lower=label_lower).update(**options):
+            try:
+                with transaction.atomic():
+                    self.create(label_lower=label_lower, generation=initial or 1)
+            except IntegrityError:
+                self.filter(label_lower=label_lower).update(**options)
+        return self.filter(label_lower=label_lower).values_list(
+            'generation', flat=True).get()
+
+
+class OffstudyGeneration(models.Model):
+
+    """A change counter per off-study model shared by all
+    processes.
+
+    Bumped in the same transaction as the save or delete of an
+    off-study model instance. Processes poll it to invalidate
+    their caches, see Generations.poll.
+
+    The row labelled "edc_offstudy.offstudyevent" is the
+    OffstudyEvent sequence counter.
+    """
+
+    label_lower = models.CharField(max_length=100, unique=True)
+
+    generation = models.BigIntegerField(default=0)
+
+    modified = models.DateTimeField(default=get_utcnow)
+
+    objects = OffstudyGenerationManager()
+
+    def __str__(self):
+        return f'{self.label_lower} {self.generation}'
+
+    class Meta:
+        verbose_name = 'Off-study generation'
+
+
+class ArchivedCrfManager(models.Manager):
+
+    def get_objects(self, model_cls, subject_identifier=None):
+        """Returns a list of unsaved model instances of model_cls
+        from the archive, optionally for one subject.
+        """
+        archived = self.filter(model=model_cls._meta.label_lower)
+        if subject_identifier:
+            archived = archived.filter(subject_identifier=subject_identifier)
+        return [deserialized.object
+                for obj in archived.order_by('id')
+                for deserialized in serializers.deserialize('json', obj.serialized)]
+
+
+class ArchivedCrf(models.Model):
+
+    """A CRF or non-CRF row moved out of its table because the
+    subject went off study long ago, see CrfArchive.
+
+    Read back with ArchivedCrf.objects.get_objects or
+    CrfArchive.read.
+    """
+
+    subject_identifier = models.CharField(max_length=50, db_index=True)
+
+    model = models.CharField(max_length=100, db_index=True)
+
+    object_pk = models.CharField(max_length=50)
+
+    offstudy_datetime = models.DateTimeField()
+
+    serialized = models.TextField()
+
+    archived = models.DateTimeField(default=get_utcnow)
+
+    objects = ArchivedCrfManager()
+
+    def __str__(self):
+        return f'{self.model} {self.object_pk}'
+
+    class Meta:
+        verbose_name = 'Archived CRF'
+        unique_together = ('model', 'object_pk')
+
+
+if getattr(settings, 'APP_NAME', None) == 'edc_offstudy':
     from .tests import models
@@ -2,17 +2,33 @@ from django.apps import apps as django_apps
 from django.utils import timezone
 from edc_constants.date_constants import EDC_DATETIME_FORMAT
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
-from edc_registration.models import RegisteredSubject
+
+from .formatted_datetime import FormattedDatetime
+from .subject_facts import subject_facts
+from .utils import get_appointment_model_cls, get_soft_purge
 
 NOT_CONSENTED = 'not_consented'
 INVALID_OFFSTUDY_DATETIME_CONSENT = 'invalid_offstudy_datetime_consent'
 SUBJECT_NOT_REGISTERED = 'not_registered'
 OFFSTUDY_DATETIME_BEFORE_DOB = 'offstudy_datetime_before_dob'
 INVALID_DOB = 'invalid_dob'
+OFFSTUDY_DATETIME_BEFORE_LAST_VISIT = 'offstudy_datetime_before_last_visit'
 
 
 class OffstudyError(ValidationError):
-    pass
+
+    """A ValidationError that also carries the subject and the raw
+    off-study datetime.
+
+    Datetimes in `params` are `FormattedDatetime` instances so the
+    message is only formatted if it is rendered.
+    """
+
+    def __init__(self, message, code=None, params=None,
+                 subject_identifier=None, offstudy_datetime=None):
+        super().__init__(message, code=code, params=params)
+        self.subject_identifier = subject_identifier
+        self.offstudy_datetime = offstudy_datetime
 
 
 class Offstudy:
@@ -30,79 +46,118 @@ class Offstudy:
         app_config = django_apps.get_app_config('edc_visit_tracking')
         self.visit_model_cls = app_config.visit_model_cls(
             visit_model_app_label)
-        app_config = django_apps.get_app_config('edc_appointment')
-        appointment_model_cls = django_apps.get_model(app_config.get_configuration(
-            related_visit_model=self.visit_model_cls._meta.label_lower).model)
+        appointment_model_cls = get_appointment_model_cls(self.visit_model_cls)
 
         self.registered_or_raise()
         self.consented_or_raise(**kwargs)
         self.offstudy_datetime_or_raise(**kwargs)
 
         # passes validation, now delete unused "future" appointments
-        appointment_model_cls.objects.delete_for_subject_after_date(
-            self.subject_identifier, self.offstudy_datetime)
+        self.purge_appointments(appointment_model_cls)
+
+    def purge_appointments(self, appointment_model_cls):
+        """Deletes appointments without a visit on or after
+        offstudy_datetime.
+
+        In soft-purge mode, first restores those purged before
+        offstudy_datetime and keeps a copy of those deleted.
+        """
+        if get_soft_purge():
+            purged_appointment_model_cls = django_apps.get_model(
+                'edc_offstudy.purgedappointment')
+            purged_appointment_model_cls.objects.restore(
+                self.subject_identifier, before_datetime=self.offstudy_datetime)
+            purged_appointment_model_cls.objects.purge(
+                appointment_model_cls, self.subject_identifier, self.offstudy_datetime)
+        else:
+            appointment_model_cls.objects.delete_for_subject_after_date(
+                self.subject_identifier, self.offstudy_datetime)
 
     def registered_or_raise(self, **kwargs):
         """Raises an exception if subject is not registered or
         if subject's DoB precedes the offstudy_datetime.
         """
         try:
-            obj = RegisteredSubject.objects.get(
-                subject_identifier=self.subject_identifier)
+            dob = subject_facts.dob(self.subject_identifier)
         except ObjectDoesNotExist:
             raise OffstudyError(
-                f'Unknown subject. Got {self.subject_identifier}.',
-                code=SUBJECT_NOT_REGISTERED)
+                'Unknown subject. Got %(subject_identifier)s.',
+                code=SUBJECT_NOT_REGISTERED,
+                params=dict(subject_identifier=self.subject_identifier),
+                **self.error_options)
         else:
-            if not obj.dob:
+            if not dob:
                 raise OffstudyError(
                     'Invalid date of birth. Got None',
-                    code=INVALID_DOB)
+                    code=INVALID_DOB,
+                    **self.error_options)
             else:
-                if obj.dob > timezone.localdate(self.offstudy_datetime):
-                    formatted_date = timezone.localtime(
-                        self.offstudy_datetime).strftime(EDC_DATETIME_FORMAT)
+                if dob > timezone.localdate(self.offstudy_datetime):
                     raise OffstudyError(
-                        f'Invalid off-study date. '
-                        f'Off-study date may not precede date of birth. '
-                        f'Got \'{formatted_date}\'.',
-                        code=OFFSTUDY_DATETIME_BEFORE_DOB)
+                        'Invalid off-study date. '
+                        'Off-study date may not precede date of birth. '
+                        'Got \'%(offstudy_datetime)s\'.',
+                        code=OFFSTUDY_DATETIME_BEFORE_DOB,
+                        params=dict(
+                            offstudy_datetime=FormattedDatetime(
+                                self.offstudy_datetime, EDC_DATETIME_FORMAT)),
+                        **self.error_options)
 
     def consented_or_raise(self, **kwargs):
         """Raises an exception if subject has not consented.
         """
-        if not self.consent_model_cls.objects.filter(
-                subject_identifier=self.subject_identifier).exists():
+        if not self.first_consent_datetime:
             raise OffstudyError(
                 'Unable to take subject off study. Subject has not consented. '
-                f'Got {self.subject_identifier}.', code=NOT_CONSENTED)
+                'Got %(subject_identifier)s.',
+                code=NOT_CONSENTED,
+                params=dict(subject_identifier=self.subject_identifier),
+                **self.error_options)
 
     def offstudy_datetime_or_raise(self, **kwargs):
         """Raises an exception if offstudy_datetime precedes consent_datetime.
         """
         # validate relative to the first consent datetime
-        consent = self.consent_model_cls.objects.filter(
-            subject_identifier=self.subject_identifier,
-            consent_datetime__lte=self.offstudy_datetime).order_by(
-                'consent_datetime').first()
-        if not consent:
-            formatted_date = timezone.localtime(
-                self.offstudy_datetime).strftime(EDC_DATETIME_FORMAT)
+        first_consent_datetime = self.first_consent_datetime
+        if not first_consent_datetime or first_consent_datetime > self.offstudy_datetime:
             raise OffstudyError(
-                f'Invalid off-study date. '
-                f'Off-study date may not be before the date of consent. '
-                f'Got \'{formatted_date}\'.',
-                code=INVALID_OFFSTUDY_DATETIME_CONSENT)
+                'Invalid off-study date. '
+                'Off-study date may not be before the date of consent. '
+                'Got \'%(offstudy_datetime)s\'.',
+                code=INVALID_OFFSTUDY_DATETIME_CONSENT,
+                params=dict(
+                    offstudy_datetime=FormattedDatetime(
+                        self.offstudy_datetime, EDC_DATETIME_FORMAT)),
+                **self.error_options)
         # validate relative to the last visit datetime
-        last_visit = self.visit_model_cls.objects.filter(
-            subject_identifier=self.subject_identifier).order_by(
-                'report_datetime').last()
-        if last_visit and (last_visit.report_datetime - self.offstudy_datetime).days > 0:
-            formatted_visitdate = timezone.localtime(
-                last_visit.report_datetime).strftime(EDC_DATETIME_FORMAT)
-            formatted_offstudy = timezone.localtime(
-                self.offstudy_datetime).strftime(EDC_DATETIME_FORMAT)
+        last_visit_datetime = subject_facts.last_visit_datetime(
+            self.visit_model_cls, self.subject_identifier)
+        if last_visit_datetime and (last_visit_datetime - self.offstudy_datetime).days > 0:
             raise OffstudyError(
-                f'Off-study datetime cannot precede the last visit date. '
-                f'Last visit date was on {formatted_visitdate}. '
-                f'Got {formatted_offstudy}')
+                'Off-study datetime cannot precede the last visit date. '
+                'Last visit date was on %(last_visit_datetime)s. '
+                'Got %(offstudy_datetime)s',
+                code=OFFSTUDY_DATETIME_BEFORE_LAST_VISIT,
+                params=dict(
+                    last_visit_datetime=FormattedDatetime(
+                        last_visit_datetime, EDC_DATETIME_FORMAT),
+                    offstudy_datetime=FormattedDatetime(
+                        self.offstudy_datetime, EDC_DATETIME_FORMAT)),
+                **self.error_options)
+
+    @property
+    def first_consent_datetime(self):
+        try:
+            return self._first_consent_datetime
+        except AttributeError:
+            self._first_consent_datetime = subject_facts.first_consent_datetime(
+                self.consent_model_cls, self.subject_identifier)
+        return self._first_consent_datetime
+
+    @property
+    def error_options(self):
+        """Returns the raw values attached to every OffstudyError.
+        """
+        return dict(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=self.offstudy_datetime)
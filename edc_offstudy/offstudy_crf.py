@@ -1,12 +1,74 @@
 from django.apps import apps as django_apps
-from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from edc_constants.constants import EDC_SHORT_DATE_FORMAT
 from edc_constants.date_constants import EDC_SHORT_DATETIME_FORMAT
 
+from .formatted_datetime import FormattedDatetime
+from .offstudy_snapshot import get_offstudy_snapshot
+from .subject_facts import subject_facts
+
+SUBJECT_OFFSTUDY = 'subject_offstudy'
+
 
 class SubjectOffstudyError(Exception):
-    pass
+
+    """Raised if data is reported after the off-study date.
+
+    Carries the error code, the subject and the raw datetimes.
+    The message is only formatted when the exception is rendered.
+    """
+
+    def __init__(self, message=None, code=None, params=None,
+                 subject_identifier=None, offstudy_datetime=None,
+                 report_datetime=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.params = params
+        self.subject_identifier = subject_identifier
+        self.offstudy_datetime = offstudy_datetime
+        self.report_datetime = report_datetime
+
+    def __str__(self):
+        if self.params:
+            return self.message % self.params
+        return str(self.message)
+
+
+def is_offstudy(offstudy_datetime=None, report_datetime=None,
+                compare_as_datetimes=None):
+    """Returns True if report_datetime is after the offstudy_datetime.
+
+    Used by OffstudyCrf.onstudy_or_raise.
+    """
+    if not offstudy_datetime:
+        return False
+    if compare_as_datetimes:
+        return offstudy_datetime < report_datetime
+    return timezone.localdate(offstudy_datetime) < report_datetime.date()
+
+
+def subject_offstudy_error(subject_identifier=None, offstudy_datetime=None,
+                           report_datetime=None, compare_as_datetimes=None):
+    """Returns a SubjectOffstudyError for data reported
+    after the off-study date.
+    """
+    if compare_as_datetimes:
+        date_format = EDC_SHORT_DATETIME_FORMAT
+    else:
+        date_format = EDC_SHORT_DATE_FORMAT
+    return SubjectOffstudyError(
+        'Invalid. '
+        'Participant was reported off-study on %(offstudy_datetime)s. '
+        'Scheduled data reported after the off-study date '
+        'may not be captured.',
+        code=SUBJECT_OFFSTUDY,
+        params=dict(
+            offstudy_datetime=FormattedDatetime(
+                offstudy_datetime, date_format)),
+        subject_identifier=subject_identifier,
+        offstudy_datetime=offstudy_datetime,
+        report_datetime=report_datetime)
 
 
 class OffstudyCrf:
@@ -28,23 +90,28 @@ class OffstudyCrf:
     def onstudy_or_raise(self, **kwargs):
         """Raises an exception if subject is off-study relative to this
         CRF's report_datetime.
+
+        The offstudy_datetime is read from the snapshot, if enabled,
+        or through subject_facts so that checks in the same scope
+        share one query.
         """
-        if self.compare_as_datetimes:
-            opts = {'offstudy_datetime__lt': self.report_datetime}
-            date_format = EDC_SHORT_DATETIME_FORMAT
-        else:
-            opts = {'offstudy_datetime__date__lt': self.report_datetime.date()}
-            date_format = EDC_SHORT_DATE_FORMAT
-        try:
-            offstudy_model_obj = self.offstudy_model_cls.objects.get(
-                subject_identifier=self.subject_identifier, **opts)
-        except ObjectDoesNotExist:
-            offstudy_model_obj = None
+        snapshot = get_offstudy_snapshot()
+        if snapshot:
+            offstudy_datetime = snapshot.get(
+                self.offstudy_model_cls, self.subject_identifier)
         else:
-            formatted_offstudy_datetime = timezone.localtime(
-                offstudy_model_obj.offstudy_datetime).strftime(date_format)
-            raise SubjectOffstudyError(
-                f'Invalid. '
-                f'Participant was reported off-study on {formatted_offstudy_datetime}. '
-                f'Scheduled data reported after the off-study date '
-                f'may not be captured.')
+            offstudy_datetime = subject_facts.offstudy_datetime(
+                self.offstudy_model_cls, self.subject_identifier)
+        if is_offstudy(offstudy_datetime=offstudy_datetime,
+                       report_datetime=self.report_datetime,
+                       compare_as_datetimes=self.compare_as_datetimes):
+            raise self.offstudy_error(offstudy_datetime)
+
+    def offstudy_error(self, offstudy_datetime):
+        """Returns a SubjectOffstudyError for this subject.
+        """
+        return subject_offstudy_error(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=offstudy_datetime,
+            report_datetime=self.report_datetime,
+            compare_as_datetimes=self.compare_as_datetimes)
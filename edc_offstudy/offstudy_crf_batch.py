@@ -0,0 +1,100 @@
+from .offstudy_crf import is_offstudy, subject_offstudy_error
+from .site_offstudy_models import site_offstudy_models
+from .utils import get_visit_field
+
+
+class OffstudyCrfBatchError(Exception):
+    pass
+
+
+class OffstudyCrfBatch:
+
+    """Validates a batch of CRF model instances against off-study
+    datetimes.
+
+    Per chunk, the visits are fetched in one query and the
+    off-study datetimes in one query per off-study model.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, model_cls=None, objs=None, chunk_size=None):
+        self.model_cls = model_cls
+        self.objs = list(objs or [])
+        self.chunk_size = chunk_size or self.chunk_size
+        self.compare_as_datetimes = model_cls.offstudy_compare_dates_as_datetimes
+        self.visit_field = get_visit_field(model_cls)
+        if not self.visit_field:
+            raise OffstudyCrfBatchError(
+                f'Unable to determine the visit foreign key. '
+                f'See {model_cls._meta.label_lower}.')
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}('
+                f'{self.model_cls._meta.label_lower}, objs={len(self.objs)})')
+
+    @property
+    def violations(self):
+        """Returns a list of (obj, SubjectOffstudyError) for each
+        obj reported after the subject's off-study date.
+        """
+        violations = []
+        for index in range(0, len(self.objs), self.chunk_size):
+            violations.extend(
+                self.chunk_violations(self.objs[index:index + self.chunk_size]))
+        return violations
+
+    def chunk_violations(self, objs):
+        visits = self.get_visits(objs)
+        offstudy_datetimes = self.get_offstudy_datetimes(visits.values())
+        violations = []
+        for obj in objs:
+            subject_identifier, offstudy_model_cls = visits.get(
+                getattr(obj, self.visit_field.attname))
+            offstudy_datetime = offstudy_datetimes.get(
+                (offstudy_model_cls, subject_identifier))
+            if is_offstudy(offstudy_datetime=offstudy_datetime,
+                           report_datetime=obj.report_datetime,
+                           compare_as_datetimes=self.compare_as_datetimes):
+                violations.append((obj, subject_offstudy_error(
+                    subject_identifier=subject_identifier,
+                    offstudy_datetime=offstudy_datetime,
+                    report_datetime=obj.report_datetime,
+                    compare_as_datetimes=self.compare_as_datetimes)))
+        return violations
+
+    def get_visits(self, objs):
+        """Returns a dictionary of {visit pk: (subject_identifier, offstudy_model_cls)}.
+        """
+        visit_model_cls = self.visit_field.related_model
+        visit_pks = {getattr(obj, self.visit_field.attname) for obj in objs}
+        visits = {}
+        for pk, subject_identifier, visit_schedule_name in (
+                visit_model_cls.objects.filter(pk__in=visit_pks).values_list(
+                    'pk', 'subject_identifier', 'visit_schedule_name')):
+            visits[pk] = (
+                subject_identifier,
+                site_offstudy_models.get_by_visit_schedule(visit_schedule_name))
+        missing = visit_pks - set(visits)
+        if missing:
+            raise OffstudyCrfBatchError(
+                f'Unknown visit. See {self.model_cls._meta.label_lower}. '
+                f'Got {missing}.')
+        return visits
+
+    def get_offstudy_datetimes(self, visits):
+        """Returns a dictionary of {(offstudy_model_cls, subject_identifier): offstudy_datetime}
+        with one query per off-study model.
+        """
+        subject_identifiers = {}
+        for subject_identifier, offstudy_model_cls in visits:
+            subject_identifiers.setdefault(offstudy_model_cls, set()).add(subject_identifier)
+        offstudy_datetimes = {}
+        for offstudy_model_cls, identifiers in subject_identifiers.items():
+            for subject_identifier, offstudy_datetime in (
+                    offstudy_model_cls.objects.filter(
+                        subject_identifier__in=identifiers).values_list(
+                            'subject_identifier', 'offstudy_datetime')):
+                offstudy_datetimes.update(
+                    {(offstudy_model_cls, subject_identifier): offstudy_datetime})
+        return offstudy_datetimes
@@ -0,0 +1,44 @@
+from django.db.models import Exists, OuterRef, Subquery
+
+from .site_offstudy_models import site_offstudy_models
+
+
+def offstudy_subquery(visit_schedule_name, subject_field=None):
+    """Returns a queryset of the visit schedule's off-study model
+    correlated to the outer query's `subject_field`.
+    """
+    offstudy_model_cls = site_offstudy_models.get_by_visit_schedule(visit_schedule_name)
+    return offstudy_model_cls.objects.filter(
+        subject_identifier=OuterRef(subject_field or 'subject_identifier')).order_by()
+
+
+def exclude_offstudy(queryset, visit_schedule_name, subject_field=None,
+                     before_datetime=None):
+    """Returns the queryset without the subjects that are off study
+    for the visit schedule, using one correlated subquery.
+
+    For example, to skip off-study subjects before creating
+    appointments for a new visit:
+
+        enrollments = exclude_offstudy(
+            Enrollment.objects.all(), 'visit_schedule')
+
+    If `before_datetime` is given, only subjects off study
+    before it are excluded.
+    """
+    offstudy = offstudy_subquery(visit_schedule_name, subject_field)
+    if before_datetime:
+        offstudy = offstudy.filter(offstudy_datetime__lt=before_datetime)
+    return queryset.annotate(offstudy_exists=Exists(offstudy)).filter(
+        offstudy_exists=False)
+
+
+def annotate_offstudy_datetime(queryset, visit_schedule_name, subject_field=None):
+    """Returns the queryset annotated with "offstudy_datetime" for the
+    visit schedule, or None if on study, using one correlated subquery.
+
+    Callers may cap new appointments at the annotated datetime.
+    """
+    offstudy = offstudy_subquery(visit_schedule_name, subject_field)
+    return queryset.annotate(offstudy_datetime=Subquery(
+        offstudy.values('offstudy_datetime')[:1]))
@@ -0,0 +1,70 @@
+from django.db.models import CharField, Value
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+from .site_offstudy_models import site_offstudy_models
+
+
+class OffstudyResolver:
+
+    """Resolves the off-study datetime per visit schedule for
+    many subjects.
+
+    The off-study model tables of all visit schedules are read
+    with one UNION ALL query per chunk of subject identifiers.
+
+    For example:
+
+        resolver = OffstudyResolver()
+        resolver.resolve(['111111111', '222222222'])
+        {'111111111': {'visit_schedule': datetime(...)}}
+    """
+
+    chunk_size = 1000
+
+    def __init__(self, visit_schedule_names=None, chunk_size=None):
+        self.visit_schedule_names = sorted(
+            visit_schedule_names or site_visit_schedules.registry)
+        self.chunk_size = chunk_size or self.chunk_size
+        self.offstudy_model_clss = {}
+        for name in self.visit_schedule_names:
+            model_cls = site_offstudy_models.get_by_visit_schedule(name)
+            self.offstudy_model_clss.setdefault(model_cls, []).append(name)
+        self.visit_schedule_names_by_label = {
+            model_cls._meta.label_lower: names
+            for model_cls, names in self.offstudy_model_clss.items()}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.visit_schedule_names})'
+
+    def resolve(self, subject_identifiers):
+        """Returns a dictionary of {subject_identifier: {visit_schedule_name:
+        offstudy_datetime}} for subjects that are off study.
+        """
+        subject_identifiers = sorted(set(subject_identifiers))
+        resolved = {}
+        for index in range(0, len(subject_identifiers), self.chunk_size):
+            queryset = self.get_queryset(
+                subject_identifiers[index:index + self.chunk_size])
+            if queryset is None:
+                break
+            for subject_identifier, offstudy_datetime, label_lower in queryset:
+                for name in self.visit_schedule_names_by_label[label_lower]:
+                    resolved.setdefault(subject_identifier, {}).update(
+                        {name: offstudy_datetime})
+        return resolved
+
+    def get_queryset(self, subject_identifiers):
+        """Returns a UNION ALL of values_list querysets, one per
+        off-study model, or None.
+        """
+        querysets = []
+        for model_cls in self.offstudy_model_clss:
+            label_lower = Value(model_cls._meta.label_lower, output_field=CharField())
+            querysets.append(
+                model_cls.objects.filter(subject_identifier__in=subject_identifiers)
+                .annotate(label_lower=label_lower)
+                .order_by()
+                .values_list('subject_identifier', 'offstudy_datetime', 'label_lower'))
+        if not querysets:
+            return None
+        return querysets[0].union(*querysets[1:], all=True)
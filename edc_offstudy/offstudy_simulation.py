@@ -0,0 +1,130 @@
+from datetime import timedelta
+from django.apps import apps as django_apps
+
+from .offstudy_crf import is_offstudy
+from .site_offstudy_models import get_visit_schedule_name
+from .utils import get_appointment_model_cls, get_crf_models
+
+
+class OffstudySimulationError(Exception):
+    pass
+
+
+class OffstudySimulation:
+
+    """A read-only what-if of taking subjects off study.
+
+    For a list of (subject_identifier, offstudy_datetime) returns,
+    per subject, the number of appointments Offstudy would purge
+    and the number of existing CRFs and non-CRFs that would be
+    reported after the off-study date.
+
+    Nothing is written; Offstudy is not called. Each model is
+    read with one query per chunk of subjects.
+
+    If `visit_schedule_name` is given, only CRFs and non-CRFs of
+    that visit schedule are counted. Appointments of all visit
+    schedules are counted since Offstudy purges them all.
+    """
+
+    chunk_size = 1000
+
+    def __init__(self, offstudy_datetimes=None, visit_schedule_name=None,
+                 chunk_size=None):
+        self.offstudy_datetimes = dict(offstudy_datetimes or [])
+        self.visit_schedule_name = visit_schedule_name
+        self.chunk_size = chunk_size or self.chunk_size
+        if None in self.offstudy_datetimes.values():
+            raise OffstudySimulationError(
+                'Expected an offstudy_datetime for each subject. Got None.')
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(subjects={len(self.offstudy_datetimes)}, '
+                f'visit_schedule_name={self.visit_schedule_name})')
+
+    def run(self):
+        """Returns a dictionary of {subject_identifier: {'appointments': n,
+        label_lower: n, ...}}.
+        """
+        results = {subject_identifier: dict(appointments=0)
+                   for subject_identifier in self.offstudy_datetimes}
+        subject_identifiers = sorted(self.offstudy_datetimes)
+        for index in range(0, len(subject_identifiers), self.chunk_size):
+            chunk = subject_identifiers[index:index + self.chunk_size]
+            for subject_identifier in self.purged_appointments(chunk):
+                results[subject_identifier]['appointments'] += 1
+            for label_lower, subject_identifier in self.violations(chunk):
+                counts = results[subject_identifier]
+                counts[label_lower] = counts.get(label_lower, 0) + 1
+        return results
+
+    @staticmethod
+    def totals(results):
+        """Returns the sum of each count over all subjects.
+        """
+        totals = {}
+        for counts in results.values():
+            for key, count in counts.items():
+                totals[key] = totals.get(key, 0) + count
+        return totals
+
+    def lower_bound(self, subject_identifiers):
+        """Returns a datetime before which no row can be affected.
+
+        A day is subtracted since CRFs may compare as dates.
+        """
+        return min(self.offstudy_datetimes[s] for s in subject_identifiers) - timedelta(days=1)
+
+    @property
+    def appointment_model_clss(self):
+        app_config = django_apps.get_app_config('edc_visit_tracking')
+        return {
+            get_appointment_model_cls(app_config.visit_model_cls(app_label)):
+            app_config.visit_model_cls(app_label)
+            for app_label in app_config.visit_models}
+
+    def purged_appointments(self, subject_identifiers):
+        """Yields the subject_identifier of each appointment without a
+        visit on or after the subject's offstudy_datetime.
+        """
+        for appointment_model_cls, visit_model_cls in self.appointment_model_clss.items():
+            visit_query_name = visit_model_cls._meta.get_field(
+                'appointment').related_query_name()
+            appointments = appointment_model_cls.objects.filter(
+                subject_identifier__in=subject_identifiers,
+                appt_datetime__gte=self.lower_bound(subject_identifiers),
+                **{f'{visit_query_name}__isnull': True}).values_list(
+                    'subject_identifier', 'appt_datetime')
+            for subject_identifier, appt_datetime in appointments:
+                if appt_datetime >= self.offstudy_datetimes[subject_identifier]:
+                    yield subject_identifier
+
+    def violations(self, subject_identifiers):
+        """Yields (label_lower, subject_identifier) for each CRF or
+        non-CRF reported after the subject's offstudy_datetime.
+        """
+        for model_cls, subject_lookup, schedule_lookup in self.get_models():
+            queryset = model_cls.objects.filter(
+                **{f'{subject_lookup}__in': subject_identifiers},
+                report_datetime__gte=self.lower_bound(subject_identifiers))
+            if schedule_lookup and self.visit_schedule_name:
+                queryset = queryset.filter(**{schedule_lookup: self.visit_schedule_name})
+            for subject_identifier, report_datetime in queryset.values_list(
+                    subject_lookup, 'report_datetime'):
+                if is_offstudy(
+                        offstudy_datetime=self.offstudy_datetimes[subject_identifier],
+                        report_datetime=report_datetime,
+                        compare_as_datetimes=model_cls.offstudy_compare_dates_as_datetimes):
+                    yield model_cls._meta.label_lower, subject_identifier
+
+    def get_models(self):
+        """Returns a list of (model_cls, subject_identifier lookup,
+        visit_schedule_name lookup) for CRF and non-CRF models.
+        """
+        models = []
+        for model_cls, subject_lookup, schedule_lookup in get_crf_models():
+            if not schedule_lookup and self.visit_schedule_name:
+                if get_visit_schedule_name(model_cls) != self.visit_schedule_name:
+                    continue
+            models.append((model_cls, subject_lookup, schedule_lookup))
+        return models
@@ -0,0 +1,169 @@
+import threading
+import time
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from django.apps import apps as django_apps
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .constants import DELETED
+from .generations import generations
+from .site_offstudy_models import site_offstudy_models
+from .subject_facts import subject_facts
+
+
+class OffstudySnapshot:
+
+    """A per-process, read-only snapshot of the subject_identifier
+    and offstudy_datetime of every off-study model instance.
+
+    Per off-study model, subject identifiers are kept in a sorted
+    list and offstudy_datetimes, as timestamps, in an array('d') of
+    the same order. Lookups use bisect.
+
+    Loaded on first use and again every `reload_intervals` times
+    `refresh_interval` seconds. In between, refreshed incrementally
+    from OffstudyEvent rows, re-reading the last `overlap` events
+    before the cursor, either when an off-study instance change
+    commits in this process (see generations) or once
+    `refresh_interval` seconds have passed. Refreshes replace the
+    lists; readers are never blocked.
+
+    The snapshot only reads committed data: it is never loaded or
+    refreshed inside a transaction. If stale inside a transaction,
+    or if the thread changed an off-study instance in the current
+    transaction, `get` reads through subject_facts instead.
+
+    Changes by other processes are seen after refresh_interval or,
+    sooner, if AppConfig.generation_poll_interval is set.
+
+    Changes that bypass the model, e.g. queryset.update(), write no
+    OffstudyEvent and are not seen until the next load().
+
+    Enable with AppConfig.offstudy_snapshot, see get_offstudy_snapshot.
+    """
+
+    refresh_interval = 1.0
+    reload_intervals = 60
+    overlap = 100
+
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval or self.refresh_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(cursor={self.cursor})'
+
+    def reset(self):
+        self._models = {}
+        self.cursor = None
+        self.generation = None
+        self.refreshed = None
+        self.loaded = None
+
+    @property
+    def event_model_cls(self):
+        return django_apps.get_model('edc_offstudy.offstudyevent')
+
+    @property
+    def stale(self):
+        if self.generation != generations.committed_total:
+            return True
+        return time.monotonic() - self.refreshed > self.refresh_interval
+
+    @property
+    def reload_required(self):
+        if self.cursor is None:
+            return True
+        return time.monotonic() - self.loaded > self.refresh_interval * self.reload_intervals
+
+    def load(self):
+        """Loads all off-study model instances, one query per model.
+        """
+        with self._lock:
+            generation = generations.committed_total
+            cursor = self.event_model_cls.objects.aggregate(
+                cursor=Max('sequence')).get('cursor') or 0
+            models = {}
+            for model_cls in set(site_offstudy_models.labels.values()):
+                rows = sorted(model_cls.objects.values_list(
+                    'subject_identifier', 'offstudy_datetime'))
+                models.update({model_cls._meta.label_lower: (
+                    [row[0] for row in rows],
+                    array('d', [row[1].timestamp() for row in rows]))})
+            self._models = models
+            self.cursor, self.generation = cursor, generation
+            self.refreshed = self.loaded = time.monotonic()
+
+    def refresh(self):
+        """Applies OffstudyEvents after the cursor, re-applying the
+        last `overlap` events before it. Since events are applied in
+        order, re-applying them leaves the snapshot as is.
+        """
+        with self._lock:
+            generation = generations.committed_total
+            events = self.event_model_cls.objects.filter(
+                sequence__gt=self.cursor - self.overlap).order_by('sequence').values_list(
+                    'sequence', 'offstudy_model', 'subject_identifier',
+                    'offstudy_datetime', 'change_type')
+            models = dict(self._models)
+            copied = set()
+            for sequence, label_lower, subject_identifier, offstudy_datetime, change_type in events:
+                if label_lower not in copied:
+                    subjects, timestamps = models.get(label_lower, ([], array('d')))
+                    models[label_lower] = (list(subjects), array('d', timestamps))
+                    copied.add(label_lower)
+                self.apply(models[label_lower], subject_identifier,
+                           offstudy_datetime, change_type)
+                self.cursor = max(self.cursor, sequence)
+            self._models = models
+            self.generation = generation
+            self.refreshed = time.monotonic()
+
+    @staticmethod
+    def apply(model, subject_identifier, offstudy_datetime, change_type):
+        subjects, timestamps = model
+        index = bisect_left(subjects, subject_identifier)
+        found = index < len(subjects) and subjects[index] == subject_identifier
+        if change_type == DELETED:
+            if found:
+                del subjects[index]
+                del timestamps[index]
+        elif found:
+            timestamps[index] = offstudy_datetime.timestamp()
+        else:
+            subjects.insert(index, subject_identifier)
+            timestamps.insert(index, offstudy_datetime.timestamp())
+
+    def get(self, offstudy_model_cls, subject_identifier):
+        """Returns the offstudy_datetime or None.
+        """
+        if connection.in_atomic_block:
+            if self.cursor is None or self.stale or generations.pending:
+                return subject_facts.offstudy_datetime(offstudy_model_cls, subject_identifier)
+        elif self.reload_required:
+            self.load()
+        elif self.stale:
+            self.refresh()
+        subjects, timestamps = self._models.get(
+            offstudy_model_cls._meta.label_lower, ([], array('d')))
+        index = bisect_left(subjects, subject_identifier)
+        if index < len(subjects) and subjects[index] == subject_identifier:
+            return datetime.fromtimestamp(timestamps[index], tz=timezone.utc)
+        return None
+
+
+offstudy_snapshot = OffstudySnapshot()
+
+
+def get_offstudy_snapshot():
+    """Returns the snapshot if AppConfig.offstudy_snapshot is True,
+    otherwise None.
+    """
+    if getattr(django_apps.get_app_config('edc_offstudy'), 'offstudy_snapshot', False):
+        return offstudy_snapshot
+    return None
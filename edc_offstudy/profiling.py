@@ -0,0 +1,98 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from django.conf import settings
+from django.db import connection
+from functools import wraps
+
+_local = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def get_profile_rate():
+    """Returns the fraction of calls to profile, from
+    settings.EDC_OFFSTUDY_PROFILE_RATE (default 0, disabled).
+    """
+    return float(getattr(settings, 'EDC_OFFSTUDY_PROFILE_RATE', 0) or 0)
+
+
+def get_profile_dir():
+    return getattr(settings, 'EDC_OFFSTUDY_PROFILE_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'edc_offstudy_profiles')
+
+
+def profiled(name):
+    """A decorator that, for a sampled fraction of calls, captures
+    cProfile stats and the SQL executed and writes them to the
+    profile directory. See write_profile.
+
+    For development only. Toggle with settings:
+        EDC_OFFSTUDY_PROFILE_RATE = 0.1  # profile 10% of calls
+        EDC_OFFSTUDY_PROFILE_DIR = '/tmp/profiles'  # optional
+
+    Calls made while another profiled call is running on the
+    same thread, or, since Python 3.12, on any thread, are not
+    profiled separately. Errors writing the profile are logged,
+    not raised.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            rate = get_profile_rate()
+            if not rate or getattr(_local, 'active', False) or random.random() >= rate:
+                return func(*args, **kwargs)
+            from django.test.utils import CaptureQueriesContext
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another thread is profiling (Python 3.12+)
+                return func(*args, **kwargs)
+            _local.active = True
+            context = CaptureQueriesContext(connection)
+            try:
+                with context:
+                    return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                _local.active = False
+                try:
+                    write_profile(name, profile, context.captured_queries)
+                except Exception as e:
+                    logger.error(f'Unable to write profile {name}. Got {e}.')
+        return wrapper
+    return decorator
+
+
+def write_profile(name, profile, queries, path=None):
+    """Writes `<name>-<timestamp>.prof` (load with pstats or snakeviz)
+    and a `.txt` summary of the top functions by cumulative time and
+    the SQL executed, duplicates marked. Returns the .txt path.
+    """
+    path = path or get_profile_dir()
+    os.makedirs(path, exist_ok=True)
+    filename = os.path.join(path, f'{name}-{time.time():.6f}-{threading.get_ident()}')
+    profile.dump_stats(f'{filename}.prof')
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(30)
+    counts = Counter(query['sql'] for query in queries)
+    total = sum(float(query['time']) for query in queries)
+    with open(f'{filename}.txt', 'w') as f:
+        f.write(f'{name}: {len(queries)} queries, {len(counts)} distinct, '
+                f'{total:.3f}s\n\n')
+        for query in queries:
+            duplicate = (f'[DUPLICATE x{counts[query["sql"]]}] '
+                         if counts[query['sql']] > 1 else '')
+            f.write(f'{duplicate}{query["time"]}s {query["sql"]}\n')
+        f.write('\n')
+        f.write(stream.getvalue())
+    return f'{filename}.txt'
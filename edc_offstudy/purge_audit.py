@@ -0,0 +1,179 @@
+import json
+import os
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.apps import apps as django_apps
+from django.db import connection, transaction
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+from .utils import get_appointment_model_cls
+
+
+class AppointmentPurgeAuditError(Exception):
+    pass
+
+
+class AppointmentPurgeAudit:
+
+    """Finds appointments on or after a subject's offstudy_datetime
+    that should have been deleted by Offstudy, that is, those
+    without a visit.
+
+    Off-study subjects are processed in shards of `shard_size`
+    subject identifiers by a pool of `workers` threads. Completed
+    shards are recorded in the `checkpoint` file, if given, so an
+    interrupted run can be resumed. The shards are also recorded
+    on the first run and reused on resume so that subjects taken
+    off study in between do not shift the shard boundaries; such
+    subjects are audited only if within a recorded shard. If
+    `fix` is True, the
+    appointments found are deleted in batches of `batch_size`.
+
+    Only appointments of the visit schedules that declare the
+    off-study model are considered.
+    """
+
+    shard_size = 1000
+    batch_size = 500
+
+    def __init__(self, visit_schedules=None, shard_size=None, workers=None,
+                 checkpoint=None, fix=None, batch_size=None):
+        self.visit_schedules = list(
+            visit_schedules or site_visit_schedules.registry.values())
+        self.shard_size = shard_size or self.shard_size
+        self.batch_size = batch_size or self.batch_size
+        self.workers = workers or 1
+        self.checkpoint = checkpoint
+        self.fix = fix
+        self.targets = self.get_targets()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(shard_size={self.shard_size}, '
+                f'workers={self.workers}, fix={self.fix})')
+
+    def get_targets(self):
+        """Returns a list of (offstudy_model_cls, appointment_model_cls,
+        visit query name, visit schedule names).
+        """
+        targets = {}
+        for visit_schedule in self.visit_schedules:
+            visit_model_cls = django_apps.get_model(visit_schedule.visit_model)
+            key = (django_apps.get_model(visit_schedule.offstudy_model),
+                   get_appointment_model_cls(visit_model_cls),
+                   visit_model_cls._meta.get_field('appointment').related_query_name())
+            targets.setdefault(key, []).append(visit_schedule.name)
+        return [key + (names, ) for key, names in targets.items()]
+
+    def get_shards(self):
+        """Returns a sorted list of (first, last) subject identifier
+        ranges covering all off-study subjects.
+        """
+        subject_identifiers = set()
+        for offstudy_model_cls in {target[0] for target in self.targets}:
+            subject_identifiers.update(
+                offstudy_model_cls.objects.values_list('subject_identifier', flat=True))
+        subject_identifiers = sorted(subject_identifiers)
+        return [
+            (subject_identifiers[index],
+             subject_identifiers[index:index + self.shard_size][-1])
+            for index in range(0, len(subject_identifiers), self.shard_size)]
+
+    def run(self):
+        """Audits all shards not yet in the checkpoint and returns
+        the checkpoint dictionary.
+        """
+        checkpoint = self.read_checkpoint()
+        if checkpoint.get('shards') is None:
+            checkpoint['shards'] = [list(shard) for shard in self.get_shards()]
+            self.write_checkpoint(checkpoint)
+        shards = [tuple(shard) for shard in checkpoint['shards']
+                  if self.shard_key(shard) not in checkpoint['completed']]
+        if self.workers == 1:
+            for shard in shards:
+                self.update_checkpoint(checkpoint, *self.audit_shard(shard))
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.audit_shard_in_thread, shard)
+                           for shard in shards]
+                for future in as_completed(futures):
+                    self.update_checkpoint(checkpoint, *future.result())
+        return checkpoint
+
+    def audit_shard_in_thread(self, shard):
+        try:
+            return self.audit_shard(shard)
+        finally:
+            connection.close()
+
+    def audit_shard(self, shard):
+        """Returns a tuple of (shard, number found, number deleted).
+        """
+        found = deleted = 0
+        for target in self.targets:
+            pks = self.get_orphan_pks(shard, *target)
+            found += len(pks)
+            if self.fix:
+                deleted += self.delete(target[1], pks)
+        return shard, found, deleted
+
+    def get_orphan_pks(self, shard, offstudy_model_cls, appointment_model_cls,
+                       visit_query_name, visit_schedule_names):
+        """Returns the pks of appointments without a visit on or after
+        the subject's offstudy_datetime using one query per model.
+        """
+        first, last = shard
+        offstudy_datetimes = dict(offstudy_model_cls.objects.filter(
+            subject_identifier__gte=first, subject_identifier__lte=last).values_list(
+                'subject_identifier', 'offstudy_datetime'))
+        if not offstudy_datetimes:
+            return []
+        appointments = appointment_model_cls.objects.filter(
+            subject_identifier__gte=first,
+            subject_identifier__lte=last,
+            visit_schedule_name__in=visit_schedule_names,
+            appt_datetime__gte=min(offstudy_datetimes.values()),
+            **{f'{visit_query_name}__isnull': True}).values_list(
+                'pk', 'subject_identifier', 'appt_datetime')
+        pks = []
+        for pk, subject_identifier, appt_datetime in appointments:
+            offstudy_datetime = offstudy_datetimes.get(subject_identifier)
+            if offstudy_datetime and appt_datetime >= offstudy_datetime:
+                pks.append(pk)
+        return pks
+
+    def delete(self, appointment_model_cls, pks):
+        deleted = 0
+        for index in range(0, len(pks), self.batch_size):
+            with transaction.atomic():
+                _, deleted_by_model = appointment_model_cls.objects.filter(
+                    pk__in=pks[index:index + self.batch_size]).delete()
+            deleted += deleted_by_model.get(appointment_model_cls._meta.label, 0)
+        return deleted
+
+    @staticmethod
+    def shard_key(shard):
+        return ':'.join(shard)
+
+    def read_checkpoint(self):
+        checkpoint = dict(shards=None, completed=[], found=0, deleted=0)
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                try:
+                    checkpoint.update(json.load(f))
+                except ValueError as e:
+                    raise AppointmentPurgeAuditError(
+                        f'Invalid checkpoint file. Got {self.checkpoint}. {e}')
+        return checkpoint
+
+    def update_checkpoint(self, checkpoint, shard, found, deleted):
+        checkpoint['completed'].append(self.shard_key(shard))
+        checkpoint['found'] += found
+        checkpoint['deleted'] += deleted
+        self.write_checkpoint(checkpoint)
+
+    def write_checkpoint(self, checkpoint):
+        if self.checkpoint:
+            path = f'{self.checkpoint}.tmp'
+            with open(path, 'w') as f:
+                json.dump(checkpoint, f)
+            os.replace(path, self.checkpoint)
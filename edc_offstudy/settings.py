@@ -53,9 +53,9 @@ INSTALLED_APPS = [
     'edc_lab.apps.AppConfig',
     'edc_identifier.apps.AppConfig',
     'edc_metadata.apps.AppConfig',
-    'edc_offstudy.apps.EdcVisitTrackingAppConfig',
-    'edc_offstudy.apps.EdcAppointmentAppConfig',
-    'edc_offstudy.apps.EdcFacilityAppConfig',
+    'edc_offstudy.tests.apps.EdcVisitTrackingAppConfig',
+    'edc_offstudy.tests.apps.EdcAppointmentAppConfig',
+    'edc_offstudy.tests.apps.EdcFacilityAppConfig',
     'edc_offstudy.apps.AppConfig',
 ]
 
@@ -67,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'edc_offstudy.middleware.SubjectFactsMiddleware',
 ]
 
 
@@ -140,6 +141,10 @@ STATIC_URL = '/static/'
 COUNTRY = 'botswana'
 HOLIDAY_FILE = os.path.join(BASE_DIR, APP_NAME, 'tests', 'holidays.csv')
 
+# the test models BadSubjectOffstudy1, BadSubjectOffstudy2 and
+# BadNonCrfOne are misconfigured on purpose
+SILENCED_SYSTEM_CHECKS = ['edc_offstudy.E001', 'edc_offstudy.E004']
+
 
 if 'test' in sys.argv:
 
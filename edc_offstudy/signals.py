@@ -1,20 +1,95 @@
+from django.apps import apps as django_apps
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
+from edc_registration.models import RegisteredSubject
 from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 
+from .constants import DELETED
+from .generations import generations
+from .models import OffstudyEvent, OffstudyGeneration, PurgedAppointment
+from .subject_facts import subject_facts
+from .utils import get_soft_purge
+
 
-@receiver(post_save, weak=False, dispatch_uid='offstudy_model_on_post_save')
 def offstudy_model_on_post_save(sender, instance, raw, created, **kwargs):
-    if not raw:
+    """Refreshes the enrolled schedule on update, if required.
+    """
+    if not raw and not created and instance.offstudy_refresh_required():
+        visit_schedule = site_visit_schedules.get_visit_schedule(
+            visit_schedule_name=instance.visit_schedule_name)
+        schedule = visit_schedule.schedules.get(instance.schedule_name)
+        schedule.refresh_enrolled_schedule(
+            subject_identifier=instance.subject_identifier,
+            consent_identifier=instance.consent_identifier)
+
+
+def offstudy_model_on_post_delete(sender, instance, **kwargs):
+    """Writes the DELETED OffstudyEvent and bumps the OffstudyGeneration
+    in the delete's transaction, and bumps the local generation on
+    commit, for instance and queryset deletes.
+
+    In soft-purge mode, restores the subject's purged appointments.
+    """
+    OffstudyEvent.objects.create_for(instance, DELETED)
+    OffstudyGeneration.objects.bump(sender._meta.label_lower)
+    if get_soft_purge():
+        PurgedAppointment.objects.restore(instance.subject_identifier)
+    generations.bump_on_commit(sender._meta.label_lower)
+
+
+def get_offstudy_models():
+    """Returns the concrete off-study models.
+    """
+    from .model_mixins import OffstudyModelMixin
+    return [model_cls for model_cls in django_apps.get_models()
+            if issubclass(model_cls, OffstudyModelMixin)]
+
+
+def connect_offstudy_model_receivers():
+    """Connects the off-study receivers to each off-study model
+    only, instead of to every model.
+    """
+    for sender in get_offstudy_models():
+        post_save.connect(
+            offstudy_model_on_post_save, sender=sender, weak=False,
+            dispatch_uid=f'offstudy_model_on_post_save_{sender._meta.label_lower}')
+        post_delete.connect(
+            offstudy_model_on_post_delete, sender=sender, weak=False,
+            dispatch_uid=f'offstudy_model_on_post_delete_{sender._meta.label_lower}')
+
+
+def subject_facts_on_post_save(sender, instance, raw, **kwargs):
+    subject_facts.invalidate(instance.subject_identifier)
+
+
+def subject_facts_on_post_delete(sender, instance, **kwargs):
+    subject_facts.invalidate(instance.subject_identifier)
+
+
+def get_subject_facts_senders():
+    """Returns the models whose changes invalidate the
+    subject facts cache.
+
+    These are RegisteredSubject, the off-study models, the consent
+    models declared on off-study models and the visit models.
+    """
+    senders = [RegisteredSubject]
+    for model_cls in get_offstudy_models():
+        senders.append(model_cls)
         try:
-            sender.offstudy_cls
-        except AttributeError:
+            senders.append(django_apps.get_model(model_cls._meta.consent_model))
+        except (AttributeError, LookupError, ValueError, TypeError):
             pass
-        else:
-            if not created:
-                visit_schedule = site_visit_schedules.get_visit_schedule(
-                    visit_schedule_name=instance.visit_schedule_name)
-                schedule = visit_schedule.schedules.get(instance.schedule_name)
-                schedule.refresh_enrolled_schedule(
-                    subject_identifier=instance.subject_identifier,
-                    consent_identifier=instance.consent_identifier)
+    app_config = django_apps.get_app_config('edc_visit_tracking')
+    for app_label in app_config.visit_models:
+        senders.append(app_config.visit_model_cls(app_label))
+    return list(set(senders))
+
+
+def connect_subject_facts_receivers():
+    for sender in get_subject_facts_senders():
+        post_save.connect(
+            subject_facts_on_post_save, sender=sender, weak=False,
+            dispatch_uid=f'subject_facts_on_post_save_{sender._meta.label_lower}')
+        post_delete.connect(
+            subject_facts_on_post_delete, sender=sender, weak=False,
+            dispatch_uid=f'subject_facts_on_post_delete_{sender._meta.label_lower}')
@@ -0,0 +1,133 @@
+from types import MappingProxyType
+
+from django.apps import apps as django_apps
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+
+class SiteOffstudyModelsError(Exception):
+    pass
+
+
+class SiteOffstudyModels:
+
+    """A precomputed, read-only map of visit schedule name, of
+    non-CRF model label and of off-study model label to the
+    off-study model class.
+
+    Loaded in AppConfig.ready(). Since visit schedules may be
+    registered after ready(), a miss reloads the map if the visit
+    schedule registry has changed since the last load; otherwise
+    it raises without reloading. Each load replaces the map; it is
+    never updated in place.
+    """
+
+    def __init__(self):
+        self.visit_schedules = MappingProxyType({})
+        self.models = MappingProxyType({})
+        self.labels = MappingProxyType({})
+        self.loaded = False
+        self.registry_key = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(loaded={self.loaded})'
+
+    @staticmethod
+    def get_registry_key():
+        """Returns a key that changes if a visit schedule is
+        registered, removed or given another off-study model.
+        """
+        return frozenset(
+            (name, visit_schedule.offstudy_model)
+            for name, visit_schedule in site_visit_schedules.registry.items())
+
+    def load(self):
+        from .model_mixins import OffstudyModelMixin, OffstudyNonCrfModelMixin
+        registry_key = self.get_registry_key()
+        visit_schedules = {}
+        for visit_schedule in site_visit_schedules.registry.values():
+            try:
+                model_cls = django_apps.get_model(visit_schedule.offstudy_model)
+            except (LookupError, ValueError, TypeError):
+                continue
+            if issubclass(model_cls, OffstudyModelMixin):
+                visit_schedules.update({visit_schedule.name: model_cls})
+        models = {}
+        labels = {}
+        for model_cls in django_apps.get_models():
+            if issubclass(model_cls, OffstudyModelMixin):
+                labels.update({model_cls._meta.label_lower: model_cls})
+            elif issubclass(model_cls, OffstudyNonCrfModelMixin):
+                visit_schedule_name = get_visit_schedule_name(model_cls)
+                if visit_schedule_name in visit_schedules:
+                    models.update({
+                        model_cls._meta.label_lower: visit_schedules.get(
+                            visit_schedule_name)})
+        self.visit_schedules = MappingProxyType(visit_schedules)
+        self.models = MappingProxyType(models)
+        self.labels = MappingProxyType(labels)
+        self.registry_key = registry_key
+        self.loaded = True
+
+    def reload(self):
+        """Reloads the map if the visit schedule registry has changed
+        since the last load and returns True, otherwise returns False.
+        """
+        if self.loaded and self.get_registry_key() == self.registry_key:
+            return False
+        self.load()
+        return True
+
+    def lookup(self, name, key):
+        """Returns the value for key from the named map, reloading
+        on a miss if the registry has changed, or raises KeyError.
+        """
+        try:
+            return getattr(self, name)[key]
+        except KeyError:
+            if not self.reload():
+                raise
+        return getattr(self, name)[key]
+
+    def get_by_visit_schedule(self, visit_schedule_name):
+        """Returns the off-study model class for the visit schedule.
+        """
+        try:
+            return self.lookup('visit_schedules', visit_schedule_name)
+        except KeyError:
+            raise SiteOffstudyModelsError(
+                f'Unable to determine the off-study model for visit schedule. '
+                f'Got visit_schedule_name={visit_schedule_name}.')
+
+    def get_by_model(self, label_lower):
+        """Returns the off-study model class for a non-CRF model.
+        """
+        try:
+            return self.lookup('models', label_lower)
+        except KeyError:
+            raise SiteOffstudyModelsError(
+                f'Unable to determine the off-study model for model. Expected '
+                f'Meta.visit_schedule_name of a visit schedule with an off-study '
+                f'model. Got {label_lower}.')
+
+    def get_by_label(self, label_lower):
+        """Returns the off-study model class for its label_lower.
+        """
+        label_lower = (label_lower or '').lower()
+        try:
+            return self.lookup('labels', label_lower)
+        except KeyError:
+            raise SiteOffstudyModelsError(
+                f'Unknown off-study model. Got {label_lower}.')
+
+
+def get_visit_schedule_name(model_cls):
+    """Returns the visit schedule name from the model's
+    Meta.visit_schedule_name ("visit_schedule.schedule") or None.
+    """
+    try:
+        return model_cls._meta.visit_schedule_name.split('.')[0]
+    except AttributeError:
+        return None
+
+
+site_offstudy_models = SiteOffstudyModels()
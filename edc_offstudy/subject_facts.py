@@ -0,0 +1,151 @@
+import threading
+
+from contextlib import contextmanager
+from django.db.models import Max, Min
+from edc_registration.models import RegisteredSubject
+
+DOB = 'dob'
+FIRST_CONSENT_DATETIME = 'first_consent_datetime'
+LAST_VISIT_DATETIME = 'last_visit_datetime'
+OFFSTUDY_DATETIME = 'offstudy_datetime'
+
+
+class NotRegistered:
+    pass
+
+
+class SubjectFacts:
+
+    """A request or transaction scoped cache of per-subject facts,
+    namely the date of birth, the first consent_datetime, the
+    last visit report_datetime and the offstudy_datetime.
+
+    Values are only cached inside a `scope()`, see also
+    SubjectFactsMiddleware. Outside of a scope every call queries.
+
+    Entries for a subject are invalidated on save or delete of
+    RegisteredSubject, the consent model, the visit model or the
+    off-study model. See signals.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(active={self.active})'
+
+    @property
+    def active(self):
+        return getattr(self._local, 'depth', 0) > 0
+
+    @contextmanager
+    def scope(self):
+        """A context manager that activates the cache for
+        the current thread.
+        """
+        if not self.active:
+            self._local.depth = 0
+            self._local.cache = {}
+        self._local.depth += 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if not self._local.depth:
+                self._local.cache = {}
+
+    def get_or_load(self, key, subject_identifier, loader):
+        if not self.active:
+            return loader()
+        try:
+            value = self._local.cache[(key, subject_identifier)]
+        except KeyError:
+            value = loader()
+            self._local.cache[(key, subject_identifier)] = value
+        return value
+
+    def invalidate(self, subject_identifier=None):
+        """Drops cached entries for the subject or all
+        entries if subject_identifier is None.
+        """
+        if self.active:
+            if subject_identifier is None:
+                self._local.cache = {}
+            else:
+                for key in [k for k in self._local.cache if k[1] == subject_identifier]:
+                    del self._local.cache[key]
+
+    def dob(self, subject_identifier):
+        """Returns the date of birth from RegisteredSubject or
+        raises RegisteredSubject.DoesNotExist.
+
+        Only the "dob" column is fetched; RegisteredSubject is
+        wide and has encrypted fields.
+        """
+        def loader():
+            return self.load_dobs([subject_identifier]).get(
+                subject_identifier, NotRegistered)
+        value = self.get_or_load(DOB, subject_identifier, loader)
+        if value is NotRegistered:
+            raise RegisteredSubject.DoesNotExist(
+                f'Unknown subject. Got {subject_identifier}.')
+        return value
+
+    def dobs(self, subject_identifiers):
+        """Returns a dictionary of {subject_identifier: dob} for
+        the registered subjects in subject_identifiers.
+
+        Uncached subjects are fetched in one query.
+        """
+        subject_identifiers = set(subject_identifiers)
+        cache = self._local.cache if self.active else {}
+        missing = [s for s in subject_identifiers if (DOB, s) not in cache]
+        dobs = self.load_dobs(missing)
+        if self.active:
+            for subject_identifier in missing:
+                cache[(DOB, subject_identifier)] = dobs.get(
+                    subject_identifier, NotRegistered)
+            dobs = {s: cache[(DOB, s)] for s in subject_identifiers}
+        return {s: dob for s, dob in dobs.items() if dob is not NotRegistered}
+
+    @staticmethod
+    def load_dobs(subject_identifiers):
+        return dict(RegisteredSubject.objects.filter(
+            subject_identifier__in=subject_identifiers).values_list(
+                'subject_identifier', 'dob'))
+
+    def first_consent_datetime(self, consent_model_cls, subject_identifier):
+        """Returns the earliest consent_datetime or None.
+        """
+        def loader():
+            return consent_model_cls.objects.filter(
+                subject_identifier=subject_identifier).aggregate(
+                    value=Min('consent_datetime')).get('value')
+        return self.get_or_load(
+            (FIRST_CONSENT_DATETIME, consent_model_cls._meta.label_lower),
+            subject_identifier, loader)
+
+    def last_visit_datetime(self, visit_model_cls, subject_identifier):
+        """Returns the latest visit report_datetime or None.
+        """
+        def loader():
+            return visit_model_cls.objects.filter(
+                subject_identifier=subject_identifier).aggregate(
+                    value=Max('report_datetime')).get('value')
+        return self.get_or_load(
+            (LAST_VISIT_DATETIME, visit_model_cls._meta.label_lower),
+            subject_identifier, loader)
+
+    def offstudy_datetime(self, offstudy_model_cls, subject_identifier):
+        """Returns the offstudy_datetime or None.
+        """
+        def loader():
+            return offstudy_model_cls.objects.filter(
+                subject_identifier=subject_identifier).values_list(
+                    'offstudy_datetime', flat=True).first()
+        return self.get_or_load(
+            (OFFSTUDY_DATETIME, offstudy_model_cls._meta.label_lower),
+            subject_identifier, loader)
+
+
+subject_facts = SubjectFacts()
@@ -1,9 +1,11 @@
 from django import template
-from django.apps import apps as django_apps
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.safestring import mark_safe
 from urllib.parse import urlencode, unquote
 
+from ..offstudy_snapshot import get_offstudy_snapshot
+from ..site_offstudy_models import site_offstudy_models
+
 register = template.Library()
 
 
@@ -11,9 +13,12 @@ register = template.Library()
 def offstudy_visit_schedule_row(subject_identifier, visit_schedule, subject_dashboard_url):
 
     context = {}
-    offstudy_model = visit_schedule.offstudy_model
-    offstudy_model_cls = django_apps.get_model(offstudy_model)
+    offstudy_model_cls = site_offstudy_models.get_by_label(
+        visit_schedule.offstudy_model)
+    snapshot = get_offstudy_snapshot()
     try:
+        if snapshot and not snapshot.get(offstudy_model_cls, subject_identifier):
+            raise offstudy_model_cls.DoesNotExist()
         obj = offstudy_model_cls.objects.get(
             subject_identifier=subject_identifier)
     except ObjectDoesNotExist:
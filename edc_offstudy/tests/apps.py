@@ -0,0 +1,23 @@
+from dateutil.relativedelta import SU, MO, TU, WE, TH, FR, SA
+from edc_appointment.appointment_config import AppointmentConfig
+from edc_appointment.apps import AppConfig as BaseEdcAppointmentAppConfig
+from edc_facility.apps import AppConfig as BaseEdcFacilityAppConfig
+from edc_visit_tracking.apps import AppConfig as BaseEdcVisitTrackingAppConfig
+
+
+class EdcVisitTrackingAppConfig(BaseEdcVisitTrackingAppConfig):
+    visit_models = {
+        'edc_offstudy': ('subject_visit', 'edc_offstudy.subjectvisit')}
+
+
+class EdcAppointmentAppConfig(BaseEdcAppointmentAppConfig):
+    configurations = [
+        AppointmentConfig(
+            model='edc_appointment.appointment',
+            related_visit_model='edc_offstudy.subjectvisit')]
+
+
+class EdcFacilityAppConfig(BaseEdcFacilityAppConfig):
+    definitions = {
+        'default': dict(days=[MO, TU, WE, TH, FR, SA, SU],
+                        slots=[100, 100, 100, 100, 100])}
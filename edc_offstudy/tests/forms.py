@@ -2,7 +2,8 @@ from django import forms
 
 from ..modelform_mixins import OffstudyModelFormMixin
 from ..modelform_mixins import OffstudyCrfModelFormMixin, OffstudyNonCrfModelFormMixin
-from .models import SubjectOffstudy, CrfOne, NonCrfOne
+from ..modelform_mixins import OffstudyVisitModelFormMixin
+from .models import SubjectOffstudy, CrfOne, NonCrfOne, SubjectVisit
 
 
 class SubjectOffstudyForm(OffstudyModelFormMixin, forms.ModelForm):
@@ -24,3 +25,10 @@ class NonCrfOneForm(OffstudyNonCrfModelFormMixin, forms.ModelForm):
     class Meta:
         model = NonCrfOne
         fields = '__all__'
+
+
+class SubjectVisitForm(OffstudyVisitModelFormMixin, forms.ModelForm):
+
+    class Meta:
+        model = SubjectVisit
+        fields = '__all__'
@@ -0,0 +1,202 @@
+import json
+import os
+import random
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dateutil.relativedelta import relativedelta
+from django.apps import apps as django_apps
+from django.db import connection, DatabaseError
+from django.test import TransactionTestCase, tag
+from edc_base.utils import get_utcnow
+from edc_consent.site_consents import site_consents
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+from edc_visit_tracking.constants import SCHEDULED
+from unittest import mock
+
+from ..locks import lock_waits
+from ..offstudy_crf import SubjectOffstudyError
+from .consents import v1_consent
+from .forms import CrfOneForm, NonCrfOneForm
+from .models import Appointment, CrfOne, Enrollment, NonCrfOne
+from .models import SubjectConsent, SubjectOffstudy, SubjectVisit
+from .visit_schedule import visit_schedule, visit_schedule2
+
+OK = 'ok'
+OFFSTUDY = 'offstudy'
+DB_ERROR = 'db_error'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[int(round(p / 100 * (len(values) - 1)))]
+
+
+@tag('load')
+class LoadTest(TransactionTestCase):
+
+    """Simulates concurrent data entry of CrfOne and NonCrfOne,
+    by model save and by form clean, against the off-study checks.
+
+    Not collected by the default test run (file is not test*.py).
+    Run explicitly and configure with environment variables:
+
+        EDC_OFFSTUDY_LOAD_USERS=200 EDC_OFFSTUDY_LOAD_OFFSTUDY_RATIO=0.1 \\
+            python manage.py test edc_offstudy.tests.load_test
+
+    Variables (default):
+        EDC_OFFSTUDY_LOAD_USERS: concurrent threads (20)
+        EDC_OFFSTUDY_LOAD_ITERATIONS: operations per thread (10)
+        EDC_OFFSTUDY_LOAD_SUBJECTS: number of subjects (20)
+        EDC_OFFSTUDY_LOAD_OFFSTUDY_RATIO: fraction of subjects off study (0.2)
+        EDC_OFFSTUDY_LOAD_LOCK_MODE: AppConfig.lock_mode (None)
+        EDC_OFFSTUDY_LOAD_SEED: random seed (0)
+
+    Prints throughput, p50/p95/p99 latency per operation and lock
+    waits as JSON. The default sqlite database serializes writers;
+    point DATABASES at PostgreSQL or MySQL for meaningful numbers.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        site_consents.register(v1_consent)
+        return super().setUpClass()
+
+    def setUp(self):
+        self.users = int(os.environ.get('EDC_OFFSTUDY_LOAD_USERS', 20))
+        self.iterations = int(os.environ.get('EDC_OFFSTUDY_LOAD_ITERATIONS', 10))
+        self.subjects = int(os.environ.get('EDC_OFFSTUDY_LOAD_SUBJECTS', 20))
+        self.offstudy_ratio = float(
+            os.environ.get('EDC_OFFSTUDY_LOAD_OFFSTUDY_RATIO', 0.2))
+        self.lock_mode = os.environ.get('EDC_OFFSTUDY_LOAD_LOCK_MODE') or None
+        self.random = random.Random(int(os.environ.get('EDC_OFFSTUDY_LOAD_SEED', 0)))
+        site_visit_schedules._registry = {}
+        site_visit_schedules.loaded = False
+        site_visit_schedules.register(visit_schedule)
+        site_visit_schedules.register(visit_schedule2)
+        self.subject_visits = [
+            self.enroll(f'{index:09d}', offstudy=index < self.subjects * self.offstudy_ratio)
+            for index in range(self.subjects)]
+
+    def enroll(self, subject_identifier, offstudy=None):
+        """Returns the first visit of a new subject, optionally
+        taking the subject off study after the visit.
+        """
+        consent_datetime = get_utcnow() - relativedelta(weeks=4)
+        SubjectConsent.objects.create(
+            subject_identifier=subject_identifier,
+            identity=subject_identifier,
+            confirm_identity=subject_identifier,
+            consent_datetime=consent_datetime,
+            dob=get_utcnow() - relativedelta(years=25))
+        Enrollment.objects.create(
+            subject_identifier=subject_identifier,
+            schedule_name='schedule',
+            report_datetime=consent_datetime,
+            facility_name='default')
+        appointment = Appointment.objects.filter(
+            subject_identifier=subject_identifier).order_by('appt_datetime')[0]
+        subject_visit = SubjectVisit.objects.create(
+            appointment=appointment,
+            visit_schedule_name=appointment.visit_schedule_name,
+            schedule_name=appointment.schedule_name,
+            visit_code=appointment.visit_code,
+            report_datetime=appointment.appt_datetime,
+            study_status=SCHEDULED)
+        if offstudy:
+            SubjectOffstudy.objects.create(
+                subject_identifier=subject_identifier,
+                offstudy_datetime=appointment.appt_datetime + relativedelta(hours=1))
+        return subject_visit, offstudy
+
+    def crf_save(self, subject_visit):
+        try:
+            CrfOne.objects.create(
+                subject_visit=subject_visit,
+                report_datetime=subject_visit.report_datetime + relativedelta(days=1))
+        except SubjectOffstudyError:
+            return OFFSTUDY
+        return OK
+
+    def crf_clean(self, subject_visit):
+        form = CrfOneForm(data=dict(
+            subject_visit=str(subject_visit.id),
+            report_datetime=subject_visit.report_datetime + relativedelta(days=1)))
+        return OK if form.is_valid() else OFFSTUDY
+
+    def non_crf_save(self, subject_visit):
+        try:
+            NonCrfOne.objects.create(
+                subject_identifier=subject_visit.subject_identifier,
+                report_datetime=get_utcnow())
+        except SubjectOffstudyError:
+            return OFFSTUDY
+        return OK
+
+    def non_crf_clean(self, subject_visit):
+        form = NonCrfOneForm(data=dict(
+            subject_identifier=subject_visit.subject_identifier,
+            report_datetime=get_utcnow()))
+        return OK if form.is_valid() else OFFSTUDY
+
+    def user(self, operations):
+        """Runs a list of (operation name, subject_visit, offstudy)
+        and returns a list of (operation name, offstudy, outcome, seconds).
+        """
+        results = []
+        try:
+            for name, subject_visit, offstudy in operations:
+                started = time.monotonic()
+                try:
+                    outcome = getattr(self, name)(subject_visit)
+                except DatabaseError:
+                    outcome = DB_ERROR
+                results.append((name, offstudy, outcome, time.monotonic() - started))
+        finally:
+            connection.close()
+        return results
+
+    def report(self, results, elapsed):
+        report = dict(
+            users=self.users, iterations=self.iterations, subjects=self.subjects,
+            offstudy_ratio=self.offstudy_ratio, lock_mode=self.lock_mode,
+            vendor=connection.vendor, elapsed=round(elapsed, 3),
+            throughput=round(len(results) / elapsed, 1), operations={},
+            lock_waits=dict(
+                count=len(lock_waits),
+                p95=percentile(list(lock_waits), 95),
+                max=max(lock_waits, default=None)))
+        for name in {result[0] for result in results}:
+            latencies = [r[3] for r in results if r[0] == name]
+            outcomes = [r[2] for r in results if r[0] == name]
+            report['operations'].update({name: dict(
+                count=len(latencies),
+                p50=percentile(latencies, 50),
+                p95=percentile(latencies, 95),
+                p99=percentile(latencies, 99),
+                **{outcome: outcomes.count(outcome)
+                   for outcome in [OK, OFFSTUDY, DB_ERROR]})})
+        return report
+
+    def test_load(self):
+        names = ['crf_save', 'crf_clean', 'non_crf_save', 'non_crf_clean']
+        operations = [
+            [(self.random.choice(names), *self.random.choice(self.subject_visits))
+             for _ in range(self.iterations)]
+            for _ in range(self.users)]
+        app_config = django_apps.get_app_config('edc_offstudy')
+        lock_waits.clear()
+        with mock.patch.object(app_config, 'lock_mode', self.lock_mode):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.users) as executor:
+                results = [r for user_results in executor.map(self.user, operations)
+                           for r in user_results]
+            elapsed = time.monotonic() - started
+        sys.stdout.write(json.dumps(self.report(results, elapsed), indent=2) + '\n')
+        self.assertEqual(len(results), self.users * self.iterations)
+        for name, offstudy, outcome, _ in results:
+            if outcome != DB_ERROR:
+                self.assertEqual(outcome, OFFSTUDY if offstudy else OK, msg=name)
@@ -10,6 +10,7 @@ from edc_visit_tracking.model_mixins import VisitModelMixin
 from edc_visit_tracking.model_mixins.crf_model_mixin import CrfModelMixin
 
 from ..model_mixins import OffstudyModelMixin, OffstudyCrfModelMixin, OffstudyNonCrfModelMixin
+from ..model_mixins import OffstudyCrfManager, OffstudyVisitModelMixin
 
 
 class SubjectConsent(NonUniqueSubjectIdentifierFieldMixin,
@@ -37,6 +38,20 @@ class SubjectVisit(VisitModelMixin, BaseUuidModel):
     appointment = models.OneToOneField(Appointment, on_delete=PROTECT)
 
 
+class VisitOne(NonUniqueSubjectIdentifierFieldMixin, OffstudyVisitModelMixin,
+               BaseUuidModel):
+
+    """A stand-in for a visit model declared with OffstudyVisitModelMixin.
+
+    SubjectVisit does not use the mixin so that tests may add visits
+    after the off-study date.
+    """
+
+    visit_schedule_name = models.CharField(max_length=25)
+
+    report_datetime = models.DateTimeField(default=get_utcnow)
+
+
 class CrfOne(OffstudyCrfModelMixin, CrfModelMixin, BaseUuidModel):
 
     subject_visit = models.ForeignKey(SubjectVisit, on_delete=PROTECT)
@@ -49,6 +64,8 @@ class CrfOne(OffstudyCrfModelMixin, CrfModelMixin, BaseUuidModel):
 
     f3 = models.CharField(max_length=50, null=True, blank=True)
 
+    objects = OffstudyCrfManager()
+
 
 class NonCrfOne(NonUniqueSubjectIdentifierFieldMixin, OffstudyNonCrfModelMixin,
                 BaseUuidModel):
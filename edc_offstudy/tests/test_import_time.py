@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase, tag
+from unittest import skipUnless
+
+
+class TestImportTime(SimpleTestCase):
+
+    """Guards the imports and import-time budget of edc_offstudy.apps.
+
+    Django itself is imported first so that only the cost of
+    edc_offstudy is measured. The budget is wall-clock and only
+    checked if EDC_BENCHMARK is set.
+    """
+
+    # microseconds, cumulative as reported by `python -X importtime`
+    budget = 20000
+
+    def import_apps(self):
+        env = {k: v for k, v in os.environ.items() if k != 'DJANGO_SETTINGS_MODULE'}
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import sys; import django.apps; import edc_offstudy.apps; '
+             'print(",".join(sorted(sys.modules)))'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        return completed.stdout.strip().split(','), completed.stderr.splitlines()
+
+    def test_import_does_not_load_other_edc_modules(self):
+        modules, _ = self.import_apps()
+        for prefix in ['edc_appointment', 'edc_facility', 'edc_visit_tracking',
+                       'edc_registration', 'dateutil']:
+            self.assertFalse(
+                [m for m in modules if m.startswith(prefix)], msg=prefix)
+
+    @tag('benchmark')
+    @skipUnless(os.environ.get('EDC_BENCHMARK'), 'Set EDC_BENCHMARK to run.')
+    def test_import_time_budget(self):
+        _, lines = self.import_apps()
+        cumulative = [
+            int(line.split('|')[1]) for line in lines
+            if line.split('|')[-1].strip() == 'edc_offstudy.apps']
+        self.assertTrue(cumulative)
+        self.assertLess(cumulative[0], self.budget)
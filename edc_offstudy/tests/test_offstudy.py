@@ -1,5 +1,17 @@
+import os
+import sys
+import tempfile
+import time
+from unittest import mock, skipUnless
+
 from dateutil.relativedelta import relativedelta
-from django.test import TestCase, tag
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ModelState
+from django.db.models.signals import post_save, post_delete
+from django.forms import BaseModelFormSet, modelformset_factory
+from django.test import TestCase, tag, override_settings
 from edc_appointment.constants import IN_PROGRESS_APPT
 from edc_base.utils import get_utcnow
 from edc_consent.site_consents import site_consents
@@ -8,16 +20,32 @@ from edc_registration.models import RegisteredSubject
 from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 from edc_visit_tracking.constants import SCHEDULED
 
-from ..model_mixins import OffstudyModelMixinError, OffstudyNonCrfModelMixinError
+from ..model_mixins import OffstudyModelMixin, OffstudyModelMixinError
+from ..model_mixins import OffstudyNonCrfModelMixinError
+from ..model_mixins import DROP, REPORT
+from ..modelform_mixins import OffstudyFormSetMixin
+from ..crf_archive import CrfArchive, CrfArchiveError
 from ..offstudy import OFFSTUDY_DATETIME_BEFORE_DOB, INVALID_DOB
 from ..offstudy import Offstudy, OffstudyError, NOT_CONSENTED
 from ..offstudy import SUBJECT_NOT_REGISTERED, INVALID_OFFSTUDY_DATETIME_CONSENT
-from ..offstudy_crf import SubjectOffstudyError
+from ..offstudy_crf import OffstudyCrf, SubjectOffstudyError, SUBJECT_OFFSTUDY
+from ..offstudy_filters import annotate_offstudy_datetime, exclude_offstudy
+from ..offstudy_simulation import OffstudySimulation
+from ..purge_audit import AppointmentPurgeAudit
+from ..constants import CREATED, UPDATED, DELETED
+from ..locks import lock_waits, subject_lock, SubjectLockError
+from ..locks import ADVISORY, SELECT_FOR_UPDATE
+from ..signals import offstudy_model_on_post_save
+from ..generations import generations
+from ..models import ArchivedCrf, OffstudyEvent, OffstudyGeneration, PurgedAppointment
+from ..checks import check_offstudy_models, check_crf_models, check_visit_schedules
+from ..site_offstudy_models import site_offstudy_models, SiteOffstudyModelsError
+from ..subject_facts import subject_facts
 from .consents import v1_consent
-from .forms import SubjectOffstudyForm, CrfOneForm, NonCrfOneForm
+from .forms import SubjectOffstudyForm, CrfOneForm, NonCrfOneForm, SubjectVisitForm
 from .models import Appointment, Enrollment, SubjectConsent, SubjectOffstudy, SubjectVisit
 from .models import BadSubjectOffstudy1, BadSubjectOffstudy2, CrfOne, NonCrfOne, BadNonCrfOne
-from .models import Enrollment2, SubjectOffstudy2
+from .models import Enrollment2, SubjectOffstudy2, VisitOne
 from .visit_schedule import visit_schedule, visit_schedule2
 
 
@@ -157,6 +185,64 @@ class TestOffstudy(TestCase):
                 label_lower='edc_offstudy.subjectoffstudy')
         self.assertEqual(cm.exception.code, INVALID_OFFSTUDY_DATETIME_CONSENT)
 
+    def test_offstudy_error_carries_raw_values(self):
+        offstudy_datetime = self.consent_datetime - relativedelta(days=1)
+        with self.assertRaises(OffstudyError) as cm:
+            Offstudy(
+                subject_identifier=self.subject_identifier,
+                offstudy_datetime=offstudy_datetime,
+                consent_model='edc_offstudy.subjectconsent',
+                label_lower='edc_offstudy.subjectoffstudy')
+        self.assertEqual(cm.exception.subject_identifier, self.subject_identifier)
+        self.assertEqual(cm.exception.offstudy_datetime, offstudy_datetime)
+        self.assertEqual(
+            cm.exception.params.get('offstudy_datetime').value, offstudy_datetime)
+        self.assertIn(
+            'Off-study date may not be before the date of consent',
+            cm.exception.messages[0])
+
+    def test_subject_facts_cached_in_scope(self):
+        with subject_facts.scope():
+            dob = subject_facts.dob(self.subject_identifier)
+            first_consent_datetime = subject_facts.first_consent_datetime(
+                SubjectConsent, self.subject_identifier)
+            self.assertEqual(first_consent_datetime, self.consent_datetime)
+            self.assertIsNone(subject_facts.last_visit_datetime(
+                SubjectVisit, self.subject_identifier))
+            with self.assertNumQueries(0):
+                self.assertEqual(subject_facts.dob(self.subject_identifier), dob)
+                subject_facts.first_consent_datetime(
+                    SubjectConsent, self.subject_identifier)
+                subject_facts.last_visit_datetime(
+                    SubjectVisit, self.subject_identifier)
+            self.assertRaises(
+                RegisteredSubject.DoesNotExist, subject_facts.dob, '12345')
+
+    def test_subject_facts_invalidated_on_save(self):
+        with subject_facts.scope():
+            subject_facts.dob(self.subject_identifier)
+            obj = RegisteredSubject.objects.get(
+                subject_identifier=self.subject_identifier)
+            obj.dob = obj.dob - relativedelta(years=1)
+            obj.save()
+            self.assertEqual(subject_facts.dob(self.subject_identifier), obj.dob)
+
+    def test_subject_facts_dobs(self):
+        with self.assertNumQueries(1):
+            dobs = subject_facts.dobs(self.subject_identifiers + ['12345'])
+        self.assertEqual(sorted(dobs), sorted(self.subject_identifiers))
+        with subject_facts.scope():
+            subject_facts.dobs(self.subject_identifiers + ['12345'])
+            with self.assertNumQueries(0):
+                subject_facts.dob(self.subject_identifier)
+                self.assertEqual(
+                    subject_facts.dobs(self.subject_identifiers + ['12345']), dobs)
+
+    def test_subject_facts_not_cached_outside_scope(self):
+        subject_facts.dob(self.subject_identifier)
+        with self.assertNumQueries(1):
+            subject_facts.dob(self.subject_identifier)
+
     def test_offstudy_with_model_mixin(self):
         off_study = BadSubjectOffstudy1()
         self.assertRaises(OffstudyModelMixinError, off_study.save)
@@ -182,6 +268,303 @@ class TestOffstudy(TestCase):
         except OffstudyError:
             self.fail('OffstudyError unexpectedly raised.')
 
+    def test_offstudy_events(self):
+        obj = SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        obj.save()
+        obj.offstudy_datetime = get_utcnow() - relativedelta(weeks=3)
+        obj.save()
+        SubjectOffstudy.objects.get(pk=obj.pk).save()
+        obj.delete()
+        events, cursor = OffstudyEvent.objects.read()
+        self.assertEqual(
+            [event.change_type for event in events], [CREATED, UPDATED, DELETED])
+        self.assertEqual(events[0].subject_identifier, self.subject_identifier)
+        self.assertEqual(events[0].offstudy_model, 'edc_offstudy.subjectoffstudy')
+        self.assertEqual(cursor, events[-1].sequence)
+        self.assertEqual(OffstudyEvent.objects.read(cursor=cursor), ([], cursor))
+        events, _ = OffstudyEvent.objects.read(cursor=events[0].sequence, limit=1)
+        self.assertEqual([event.change_type for event in events], [UPDATED])
+
+    def test_offstudy_event_sequence_in_commit_order(self):
+        SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        try:
+            with transaction.atomic():
+                SubjectOffstudy.objects.create(
+                    subject_identifier='222222222',
+                    offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+                    offstudy_reason=DEAD)
+                raise IntegrityError()
+        except IntegrityError:
+            pass
+        SubjectOffstudy.objects.create(
+            subject_identifier='333333333',
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        events, _ = OffstudyEvent.objects.read()
+        self.assertEqual(
+            [event.subject_identifier for event in events], [self.subject_identifier, '333333333'])
+        self.assertEqual(events[1].sequence, events[0].sequence + 1)
+        self.assertEqual(
+            OffstudyGeneration.objects.get(label_lower='edc_offstudy.offstudyevent').generation,
+            events[1].sequence)
+
+    def test_offstudy_event_not_written_if_invalid(self):
+        self.assertRaises(
+            OffstudyError,
+            SubjectOffstudy.objects.create,
+            subject_identifier=self.subject_consent.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=5),
+            offstudy_reason=DEAD)
+        self.assertEqual(OffstudyEvent.objects.all().count(), 0)
+
+    def test_subject_lock(self):
+        app_config = django_apps.get_app_config('edc_offstudy')
+        lock_waits.clear()
+        with mock.patch.object(app_config, 'lock_mode', SELECT_FOR_UPDATE):
+            SubjectOffstudy.objects.create(
+                subject_identifier=self.subject_identifier,
+                offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+                offstudy_reason=DEAD)
+        self.assertEqual(len(lock_waits), 1)
+        with mock.patch.object(app_config, 'lock_mode', 'blah'):
+            self.assertRaises(
+                SubjectLockError, NonCrfOne.objects.create,
+                subject_identifier=self.subject_identifier,
+                report_datetime=get_utcnow())
+
+    def test_subject_lock_mysql_in_transaction(self):
+        """Asserts the MySQL advisory lock, released on exit, is not
+        used within an outer transaction.
+        """
+        patcher = mock.patch('edc_offstudy.locks.connection')
+        locks_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        locks_connection.vendor = 'mysql'
+        with mock.patch('edc_offstudy.locks.acquire_mysql_lock') as acquire_mysql_lock:
+            with mock.patch('edc_offstudy.locks.select_for_update') as select_for_update:
+                locks_connection.in_atomic_block = True
+                with subject_lock(self.subject_identifier, mode=ADVISORY):
+                    pass
+                acquire_mysql_lock.assert_not_called()
+                select_for_update.assert_called_once_with(self.subject_identifier)
+                locks_connection.in_atomic_block = False
+                with subject_lock(self.subject_identifier, mode=ADVISORY):
+                    pass
+                acquire_mysql_lock.assert_called_once_with(self.subject_identifier)
+                self.assertEqual(select_for_update.call_count, 1)
+
+    def test_profiled_save(self):
+        with tempfile.TemporaryDirectory() as path:
+            with override_settings(EDC_OFFSTUDY_PROFILE_RATE=1,
+                                   EDC_OFFSTUDY_PROFILE_DIR=path):
+                SubjectOffstudy.objects.create(
+                    subject_identifier=self.subject_identifier,
+                    offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+                    offstudy_reason=DEAD)
+            filenames = sorted(os.listdir(path))
+            self.assertEqual(len(filenames), 2)
+            self.assertTrue(filenames[0].startswith('offstudy_model_save'))
+            with open(os.path.join(path, filenames[1])) as f:
+                self.assertIn('queries', f.readline())
+
+    def test_profiled_save_if_profiler_busy_or_write_fails(self):
+        with override_settings(EDC_OFFSTUDY_PROFILE_RATE=1):
+            with mock.patch('cProfile.Profile.enable', side_effect=ValueError):
+                obj = SubjectOffstudy.objects.create(
+                    subject_identifier=self.subject_identifier,
+                    offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+                    offstudy_reason=DEAD)
+            with mock.patch('edc_offstudy.profiling.write_profile', side_effect=OSError):
+                with self.assertLogs('edc_offstudy.profiling', level='ERROR'):
+                    obj.delete()
+        self.assertFalse(SubjectOffstudy.objects.filter(pk=obj.pk).exists())
+
+    def test_offstudy_receivers_scoped_to_offstudy_models(self):
+        non_crf_one = NonCrfOne.objects.create(
+            subject_identifier=self.subject_identifier,
+            report_datetime=get_utcnow() - relativedelta(weeks=3))
+        obj = SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        with mock.patch('edc_offstudy.signals.site_visit_schedules') as visit_schedules:
+            with mock.patch.object(NonCrfOne, 'offstudy_refresh_required',
+                                   create=True, return_value=True):
+                non_crf_one.save()
+            visit_schedules.get_visit_schedule.assert_not_called()
+            with mock.patch.object(SubjectOffstudy, 'offstudy_refresh_required',
+                                   return_value=True):
+                obj.save()
+            visit_schedules.get_visit_schedule.assert_called_once_with(
+                visit_schedule_name=obj.visit_schedule_name)
+        with mock.patch('edc_offstudy.signals.OffstudyEvent') as event_model_cls:
+            non_crf_one.delete()
+            event_model_cls.objects.create_for.assert_not_called()
+            obj.delete()
+            event_model_cls.objects.create_for.assert_called_once_with(obj, DELETED)
+
+    @tag('benchmark')
+    @skipUnless(os.environ.get('EDC_BENCHMARK'), 'Set EDC_BENCHMARK to run.')
+    def test_offstudy_receivers_scoped_benchmark(self):
+        """Times post_save dispatch for a model that is not an
+        off-study model with the receiver connected per off-study
+        model, as it is, and connected globally, as it was.
+        """
+        instance = NonCrfOne(subject_identifier=self.subject_identifier)
+
+        def global_receiver(sender, instance, raw, created, **kwargs):
+            if issubclass(sender, OffstudyModelMixin):
+                offstudy_model_on_post_save(sender, instance, raw, created, **kwargs)
+
+        def dispatch():
+            started = time.perf_counter()
+            for _ in range(10000):
+                post_save.send(
+                    sender=NonCrfOne, instance=instance, raw=True, created=False)
+            return time.perf_counter() - started
+
+        scoped = dispatch()
+        post_save.connect(global_receiver, weak=False, dispatch_uid='benchmark')
+        try:
+            unscoped = dispatch()
+        finally:
+            post_save.disconnect(dispatch_uid='benchmark')
+        sys.stdout.write(
+            f'\npost_save dispatch x10000 on NonCrfOne: scoped {scoped:.4f}s, '
+            f'global {unscoped:.4f}s, removed {unscoped - scoped:.4f}s\n')
+        self.assertLess(scoped, unscoped)
+
+    def test_offstudy_refresh_only_if_moved_later(self):
+        obj = SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        with mock.patch.object(
+                type(self.schedule), 'refresh_enrolled_schedule') as refresh:
+            obj.offstudy_datetime = obj.offstudy_datetime - relativedelta(days=1)
+            obj.save()
+            obj = SubjectOffstudy.objects.get(pk=obj.pk)
+            obj.save()
+            refresh.assert_not_called()
+            obj.offstudy_datetime = obj.offstudy_datetime + relativedelta(days=2)
+            obj.save()
+            self.assertEqual(refresh.call_count, 1)
+
+    def test_soft_purge_and_restore(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectVisit.objects.create(
+            appointment=appointments[0],
+            visit_schedule_name=appointments[0].visit_schedule_name,
+            schedule_name=appointments[0].schedule_name,
+            visit_code=appointments[0].visit_code,
+            report_datetime=appointments[0].appt_datetime,
+            study_status=SCHEDULED)
+        app_config = django_apps.get_app_config('edc_offstudy')
+        with mock.patch.object(app_config, 'soft_purge', True):
+            obj = SubjectOffstudy.objects.create(
+                offstudy_datetime=appointments[0].appt_datetime + relativedelta(hours=1),
+                subject_identifier=self.subject_identifier)
+            self.assertEqual(
+                PurgedAppointment.objects.filter(
+                    subject_identifier=self.subject_identifier).count(),
+                len(appointments) - 1)
+            obj.offstudy_datetime = appointments[1].appt_datetime + relativedelta(hours=1)
+            obj.save()
+            self.assertEqual(
+                [appt.pk for appt in Appointment.objects.filter(
+                    subject_identifier=self.subject_identifier).order_by('appt_datetime')],
+                [appt.pk for appt in appointments[:2]])
+            obj.delete()
+        self.assertEqual(
+            [appt.pk for appt in Appointment.objects.filter(
+                subject_identifier=self.subject_identifier).order_by('appt_datetime')],
+            [appt.pk for appt in appointments])
+        self.assertFalse(PurgedAppointment.objects.exists())
+
+    def test_offstudy_simulation(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        subject_visit = SubjectVisit.objects.create(
+            appointment=appointments[0],
+            visit_schedule_name=appointments[0].visit_schedule_name,
+            schedule_name=appointments[0].schedule_name,
+            visit_code=appointments[0].visit_code,
+            report_datetime=appointments[0].appt_datetime,
+            study_status=SCHEDULED)
+        CrfOne.objects.create(
+            subject_visit=subject_visit,
+            report_datetime=appointments[0].appt_datetime + relativedelta(days=1))
+        offstudy_datetime = appointments[0].appt_datetime + relativedelta(hours=1)
+        simulation = OffstudySimulation(
+            offstudy_datetimes=[(self.subject_identifier, offstudy_datetime),
+                                ('222222222', get_utcnow())])
+        results = simulation.run()
+        self.assertEqual(
+            results[self.subject_identifier],
+            {'appointments': len(appointments) - 1, 'edc_offstudy.crfone': 1})
+        self.assertEqual(results['222222222'], {'appointments': 0})
+        self.assertEqual(simulation.totals(results).get('edc_offstudy.crfone'), 1)
+        self.assertEqual(
+            Appointment.objects.filter(
+                subject_identifier=self.subject_identifier).count(), len(appointments))
+
+    def test_crf_archive(self):
+        appointment = Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')[0]
+        subject_visit = SubjectVisit.objects.create(
+            appointment=appointment,
+            visit_schedule_name=appointment.visit_schedule_name,
+            schedule_name=appointment.schedule_name,
+            visit_code=appointment.visit_code,
+            report_datetime=appointment.appt_datetime,
+            study_status=SCHEDULED)
+        crf_one = CrfOne.objects.create(
+            subject_visit=subject_visit,
+            report_datetime=appointment.appt_datetime)
+        non_crf_one = NonCrfOne.objects.create(
+            subject_identifier=self.subject_identifier,
+            report_datetime=appointment.appt_datetime)
+        SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        self.assertEqual(CrfArchive(days=30).archive(), {})
+        self.assertEqual(
+            CrfArchive(days=7, dry_run=True).archive(),
+            {'edc_offstudy.crfone': 1, 'edc_offstudy.noncrfone': 1})
+        self.assertTrue(CrfOne.objects.filter(pk=crf_one.pk).exists())
+        with mock.patch.object(CrfArchive, 'batch_size', 1):
+            self.assertEqual(
+                CrfArchive(days=7).archive(),
+                {'edc_offstudy.crfone': 1, 'edc_offstudy.noncrfone': 1})
+        self.assertFalse(CrfOne.objects.filter(pk=crf_one.pk).exists())
+        self.assertFalse(NonCrfOne.objects.filter(pk=non_crf_one.pk).exists())
+        self.assertEqual(
+            [obj.pk for obj in CrfArchive.read(CrfOne, self.subject_identifier)],
+            [crf_one.pk])
+        self.assertEqual(
+            [obj.pk for obj in CrfArchive.read(NonCrfOne, self.subject_identifier)],
+            [non_crf_one.pk])
+        self.assertEqual(CrfArchive().verify(), [])
+        self.assertRaises(CrfArchiveError, CrfArchive().archive)
+
+    def test_offstudy_event_on_queryset_delete(self):
+        SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        SubjectOffstudy.objects.filter(subject_identifier=self.subject_identifier).delete()
+        self.assertEqual(
+            [event.change_type for event in OffstudyEvent.objects.read()[0]],
+            [CREATED, DELETED])
+
     def test_off_study_date_before_consent(self):
         """Assert cannot go off study a week before consent.
         """
@@ -351,6 +734,66 @@ class TestOffstudy(TestCase):
         self.assertEquals(
             Appointment.objects.filter(subject_identifier=self.subject_identifier).count(), 4)
 
+    @override_settings(MIGRATION_MODULES={})
+    def test_models_match_migrations(self):
+        state = MigrationLoader(None, ignore_no_migrations=True).project_state()
+        for model_cls in [OffstudyEvent, PurgedAppointment, OffstudyGeneration, ArchivedCrf]:
+            self.assertEqual(
+                state.models[('edc_offstudy', model_cls._meta.model_name)],
+                ModelState.from_model(model_cls), msg=model_cls._meta.label_lower)
+
+    def test_purge_audit(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectVisit.objects.create(
+            appointment=appointments[0],
+            visit_schedule_name=appointments[0].visit_schedule_name,
+            schedule_name=appointments[0].schedule_name,
+            visit_code=appointments[0].visit_code,
+            report_datetime=appointments[0].appt_datetime,
+            study_status=SCHEDULED)
+        SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=appointments[1].appt_datetime,
+            offstudy_reason=DEAD)
+        audit = AppointmentPurgeAudit(visit_schedules=[visit_schedule])
+        self.assertEqual(audit.run().get('found'), 0)
+        # resave an appointment deleted when SubjectOffstudy was created
+        appointments[2].save()
+        audit = AppointmentPurgeAudit(visit_schedules=[visit_schedule], fix=True)
+        checkpoint = audit.run()
+        self.assertEqual(checkpoint.get('found'), 1)
+        self.assertEqual(checkpoint.get('deleted'), 1)
+        self.assertEqual(Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).count(), 1)
+
+    def test_purge_audit_resume_reuses_shards(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectOffstudy.objects.create(
+            subject_identifier=self.subject_identifier,
+            offstudy_datetime=appointments[1].appt_datetime,
+            offstudy_reason=DEAD)
+        SubjectOffstudy.objects.create(
+            subject_identifier='333333333',
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        appointments[2].save()
+        path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        checkpoint = AppointmentPurgeAudit(
+            visit_schedules=[visit_schedule], shard_size=2, checkpoint=path).run()
+        self.assertEqual(checkpoint.get('shards'), [['111111111', '333333333']])
+        self.assertEqual(checkpoint.get('found'), 1)
+        # a subject taken off study before resuming does not shift the shards
+        SubjectOffstudy.objects.create(
+            subject_identifier='222222222',
+            offstudy_datetime=get_utcnow() - relativedelta(weeks=2),
+            offstudy_reason=DEAD)
+        checkpoint = AppointmentPurgeAudit(
+            visit_schedules=[visit_schedule], shard_size=2, checkpoint=path).run()
+        self.assertEqual(checkpoint.get('completed'), ['111111111:333333333'])
+        self.assertEqual(checkpoint.get('found'), 1)
+
     def test_off_study_blocks_subject_visit(self):
         """Assert cannot enter subject visit after off study
         date because appointment no longer exists.
@@ -439,6 +882,133 @@ class TestOffstudy(TestCase):
             SubjectOffstudyError,
             crf_one.save)
 
+    def test_crf_model_mixin_error_carries_raw_values(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectVisit.objects.create(
+            appointment=appointments[0],
+            visit_schedule_name=appointments[0].visit_schedule_name,
+            schedule_name=appointments[0].schedule_name,
+            visit_code=appointments[0].visit_code,
+            report_datetime=appointments[0].appt_datetime,
+            study_status=SCHEDULED)
+        offstudy_datetime = appointments[0].appt_datetime
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=offstudy_datetime,
+            subject_identifier=self.subject_identifier)
+        # resave since instance was deleted when SubjectOffstudy model
+        # was created above
+        appointments[1].save()
+        subject_visit = SubjectVisit.objects.create(
+            appointment=appointments[1],
+            visit_schedule_name=appointments[1].visit_schedule_name,
+            schedule_name=appointments[1].schedule_name,
+            visit_code=appointments[1].visit_code,
+            report_datetime=appointments[1].appt_datetime,
+            study_status=SCHEDULED)
+        crf_one = CrfOne(
+            subject_visit=subject_visit,
+            report_datetime=appointments[1].appt_datetime)
+        with self.assertRaises(SubjectOffstudyError) as cm:
+            crf_one.save()
+        self.assertEqual(cm.exception.code, SUBJECT_OFFSTUDY)
+        self.assertEqual(cm.exception.subject_identifier, self.subject_identifier)
+        self.assertEqual(cm.exception.offstudy_datetime, offstudy_datetime)
+        self.assertIn('Participant was reported off-study on', str(cm.exception))
+
+    def test_crf_model_mixin_skips_check_if_unchanged(self):
+        appointment = Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime').first()
+        subject_visit = SubjectVisit.objects.create(
+            appointment=appointment,
+            visit_schedule_name=appointment.visit_schedule_name,
+            schedule_name=appointment.schedule_name,
+            visit_code=appointment.visit_code,
+            report_datetime=appointment.appt_datetime,
+            study_status=SCHEDULED)
+        crf_one = CrfOne(
+            subject_visit=subject_visit,
+            report_datetime=appointment.appt_datetime)
+        self.assertTrue(crf_one.offstudy_check_required())
+        crf_one.save()
+        self.assertFalse(crf_one.offstudy_check_required())
+        crf_one = CrfOne.objects.get(pk=crf_one.pk)
+        crf_one.f1 = 'blah'
+        self.assertFalse(crf_one.offstudy_check_required())
+        crf_one.report_datetime = appointment.appt_datetime + relativedelta(hours=1)
+        self.assertTrue(crf_one.offstudy_check_required())
+        crf_one = CrfOne.objects.get(pk=crf_one.pk)
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=appointment.appt_datetime + relativedelta(hours=1),
+            subject_identifier=self.subject_identifier)
+        self.assertTrue(crf_one.offstudy_check_required())
+
+    def make_crfs_for_bulk(self):
+        """Returns a list of unsaved CrfOne, one reported before and
+        one reported after the off-study date.
+        """
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        subject_visits = []
+        for appointment in appointments[0:2]:
+            subject_visits.append(SubjectVisit.objects.create(
+                appointment=appointment,
+                visit_schedule_name=appointment.visit_schedule_name,
+                schedule_name=appointment.schedule_name,
+                visit_code=appointment.visit_code,
+                report_datetime=appointment.appt_datetime,
+                study_status=SCHEDULED))
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=appointments[1].appt_datetime,
+            subject_identifier=self.subject_identifier)
+        return [
+            CrfOne(subject_visit=subject_visits[0],
+                   report_datetime=appointments[0].appt_datetime),
+            CrfOne(subject_visit=subject_visits[1],
+                   report_datetime=appointments[1].appt_datetime + relativedelta(days=1))]
+
+    def test_crf_manager_bulk_create_raises(self):
+        crfs = self.make_crfs_for_bulk()
+        self.assertRaises(SubjectOffstudyError, CrfOne.objects.bulk_create, crfs)
+        self.assertEqual(CrfOne.objects.all().count(), 0)
+
+    def test_crf_manager_bulk_create_drops(self):
+        crfs = self.make_crfs_for_bulk()
+        created = CrfOne.objects.bulk_create(crfs, offstudy_policy=DROP)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(CrfOne.objects.all().count(), 1)
+
+    def test_crf_manager_bulk_create_reports(self):
+        crfs = self.make_crfs_for_bulk()
+        violations = CrfOne.objects.bulk_create(crfs, offstudy_policy=REPORT)
+        self.assertEqual(len(violations), 1)
+        obj, error = violations[0]
+        self.assertIs(obj, crfs[1])
+        self.assertEqual(error.code, SUBJECT_OFFSTUDY)
+        self.assertEqual(
+            [crf.report_datetime for crf in CrfOne.objects.all()],
+            [crfs[0].report_datetime])
+
+    def test_crf_manager_bulk_update_reports(self):
+        crfs = self.make_crfs_for_bulk()
+        CrfOne.objects.bulk_create(crfs[0:1])
+        crfs[0].report_datetime = crfs[1].report_datetime
+        violations = CrfOne.objects.bulk_update(
+            crfs[0:1], ['report_datetime'], offstudy_policy=REPORT)
+        self.assertEqual([obj for obj, _ in violations], [crfs[0]])
+        self.assertNotEqual(
+            CrfOne.objects.get(pk=crfs[0].pk).report_datetime, crfs[1].report_datetime)
+
+    def test_crf_manager_bulk_update(self):
+        crfs = self.make_crfs_for_bulk()
+        CrfOne.objects.bulk_create(crfs[0:1])
+        crfs[0].f1 = 'blah'
+        CrfOne.objects.bulk_update(crfs[0:1], ['f1'])
+        crfs[0].report_datetime = crfs[1].report_datetime
+        self.assertRaises(
+            SubjectOffstudyError, CrfOne.objects.bulk_update,
+            crfs[0:1], ['report_datetime'])
+
     def test_non_crf_model_mixin(self):
         non_crf_one = NonCrfOne.objects.create(
             subject_identifier=self.subject_identifier)
@@ -462,6 +1032,56 @@ class TestOffstudy(TestCase):
             BadNonCrfOne.objects.create,
             subject_identifier=self.subject_identifier)
 
+    def test_site_offstudy_models(self):
+        site_offstudy_models.load()
+        self.assertEqual(
+            site_offstudy_models.get_by_visit_schedule('visit_schedule'), SubjectOffstudy)
+        self.assertEqual(
+            site_offstudy_models.get_by_visit_schedule('visit_schedule2'), SubjectOffstudy2)
+        self.assertEqual(
+            site_offstudy_models.get_by_model('edc_offstudy.noncrfone'), SubjectOffstudy)
+        self.assertNotIn('edc_offstudy.badnoncrfone', site_offstudy_models.models)
+        self.assertEqual(
+            site_offstudy_models.get_by_label('edc_offstudy.SubjectOffstudy'),
+            SubjectOffstudy)
+        with mock.patch('django.apps.apps.get_model') as get_model:
+            site_offstudy_models.get_by_label('edc_offstudy.subjectoffstudy')
+        get_model.assert_not_called()
+        self.assertRaises(
+            SiteOffstudyModelsError, site_offstudy_models.get_by_label,
+            'edc_offstudy.crfone')
+        self.assertRaises(
+            TypeError, site_offstudy_models.visit_schedules.update, {})
+
+    def test_site_offstudy_models_reloads_if_registry_changed(self):
+        site_offstudy_models.load()
+        with mock.patch.object(
+                site_offstudy_models, 'load', wraps=site_offstudy_models.load) as load:
+            for _ in range(3):
+                self.assertRaises(
+                    SiteOffstudyModelsError, site_offstudy_models.get_by_label,
+                    'edc_offstudy.blah')
+            load.assert_not_called()
+            site_visit_schedules._registry.pop(visit_schedule2.name)
+            self.assertRaises(
+                SiteOffstudyModelsError, site_offstudy_models.get_by_visit_schedule,
+                visit_schedule2.name)
+            self.assertEqual(load.call_count, 1)
+            site_visit_schedules.register(visit_schedule2)
+            self.assertEqual(
+                site_offstudy_models.get_by_visit_schedule(visit_schedule2.name),
+                SubjectOffstudy2)
+            self.assertEqual(load.call_count, 2)
+
+    def test_checks(self):
+        errors = check_offstudy_models(None)
+        self.assertEqual(
+            sorted([error.obj for error in errors], key=lambda m: m._meta.label_lower),
+            [BadSubjectOffstudy1, BadSubjectOffstudy2])
+        errors = check_crf_models(None)
+        self.assertEqual([error.obj for error in errors], [BadNonCrfOne])
+        self.assertEqual(check_visit_schedules(None), [])
+
     def test_modelform_mixin_ok(self):
         data = dict(
             subject_identifier=self.subject_identifier,
@@ -560,6 +1180,162 @@ class TestOffstudy(TestCase):
         form.is_valid()
         self.assertIn('report_datetime', form.errors)
 
+    def test_visit_modelform_mixin_not_ok(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=1),
+            subject_identifier=self.subject_identifier)
+        form = SubjectVisitForm(data=dict(
+            appointment=str(appointments[0].pk),
+            report_datetime=get_utcnow()))
+        form.is_valid()
+        self.assertEqual(
+            form.errors.as_data()['report_datetime'][0].code, SUBJECT_OFFSTUDY)
+
+    def test_visit_modelform_mixin_without_appointment(self):
+        form = SubjectVisitForm(data=dict(appointment='', report_datetime=get_utcnow()))
+        self.assertFalse(form.is_valid())
+        self.assertIn('appointment', form.errors)
+        self.assertNotIn('report_datetime', form.errors)
+
+    def test_visit_model_mixin(self):
+        VisitOne.objects.create(
+            subject_identifier=self.subject_identifier,
+            visit_schedule_name=self.visit_schedule_name,
+            report_datetime=get_utcnow() - relativedelta(days=3))
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=2),
+            subject_identifier=self.subject_identifier)
+        self.assertRaises(
+            SubjectOffstudyError, VisitOne.objects.create,
+            subject_identifier=self.subject_identifier,
+            visit_schedule_name=self.visit_schedule_name,
+            report_datetime=get_utcnow())
+        VisitOne.objects.create(
+            subject_identifier='222222222',
+            visit_schedule_name=self.visit_schedule_name,
+            report_datetime=get_utcnow())
+
+    def test_offstudy_datetime_read_once_in_scope(self):
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=1),
+            subject_identifier=self.subject_identifier)
+        with subject_facts.scope():
+            with self.assertNumQueries(1):
+                for _ in range(3):
+                    self.assertRaises(
+                        SubjectOffstudyError, OffstudyCrf,
+                        subject_identifier=self.subject_identifier,
+                        report_datetime=get_utcnow(),
+                        offstudy_model_cls=SubjectOffstudy)
+
+    def test_offstudy_filters(self):
+        offstudy_datetime = get_utcnow() - relativedelta(days=1)
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=offstudy_datetime,
+            subject_identifier=self.subject_identifier)
+        with self.assertNumQueries(1):
+            subject_identifiers = sorted(exclude_offstudy(
+                Enrollment.objects.all(), 'visit_schedule').values_list(
+                    'subject_identifier', flat=True))
+        self.assertEqual(subject_identifiers, self.subject_identifiers[1:])
+        self.assertEqual(exclude_offstudy(
+            Enrollment.objects.all(), 'visit_schedule',
+            before_datetime=offstudy_datetime).count(), 4)
+        self.assertEqual(exclude_offstudy(
+            Appointment.objects.filter(subject_identifier=self.subject_identifier),
+            'visit_schedule2').count(), Appointment.objects.filter(
+                subject_identifier=self.subject_identifier).count())
+        self.assertEqual(
+            dict(annotate_offstudy_datetime(
+                Enrollment.objects.all(), 'visit_schedule').values_list(
+                    'subject_identifier', 'offstudy_datetime')),
+            {self.subject_identifier: offstudy_datetime, '222222222': None,
+             '333333333': None, '444444444': None})
+
+    def test_offstudy_generation_poll(self):
+        app_config = django_apps.get_app_config('edc_offstudy')
+        generations.reset()
+        self.addCleanup(generations.reset)
+        label_lower = 'edc_offstudy.subjectoffstudy'
+        obj = SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=2),
+            subject_identifier=self.subject_identifier)
+        self.assertEqual(
+            OffstudyGeneration.objects.get(label_lower=label_lower).generation, 1)
+        generations.poll(force=True)
+        total = generations.total
+        # as if saved by another process
+        OffstudyGeneration.objects.bump(label_lower)
+        self.assertEqual(generations.total, total)
+        with mock.patch.object(app_config, 'generation_poll_interval', 0):
+            self.assertEqual(generations.total, total + 1)
+            self.assertEqual(generations.total, total + 1)
+        obj.delete()
+        self.assertEqual(
+            OffstudyGeneration.objects.get(label_lower=label_lower).generation, 3)
+
+    def test_non_crf_formset_mixin(self):
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=1),
+            subject_identifier=self.subject_identifier)
+        NonCrfOneFormSet = modelformset_factory(
+            NonCrfOne, form=NonCrfOneForm, fields='__all__',
+            formset=type('NonCrfOneFormSet', (OffstudyFormSetMixin, BaseModelFormSet), {}))
+        subject_identifiers = [self.subject_identifier, '222222222', self.subject_identifier]
+        data = {'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '0'}
+        for index, subject_identifier in enumerate(subject_identifiers):
+            data.update({f'form-{index}-subject_identifier': subject_identifier,
+                         f'form-{index}-report_datetime': get_utcnow()})
+        formset = NonCrfOneFormSet(data=data, queryset=NonCrfOne.objects.none())
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            ['report_datetime' in form.errors for form in formset.forms],
+            [True, False, True])
+        self.assertEqual(
+            formset.forms[0].errors.as_data()['report_datetime'][0].code, SUBJECT_OFFSTUDY)
+
+    def test_crf_formset_mixin(self):
+        appointments = [appt for appt in Appointment.objects.filter(
+            subject_identifier=self.subject_identifier).order_by('appt_datetime')]
+        SubjectOffstudy.objects.create(
+            offstudy_datetime=appointments[0].appt_datetime,
+            subject_identifier=self.subject_identifier)
+        appointments[1].save()
+        subject_visits = []
+        for appointment in appointments[0:2]:
+            subject_visits.append(SubjectVisit.objects.create(
+                appointment=appointment,
+                visit_schedule_name=appointment.visit_schedule_name,
+                schedule_name=appointment.schedule_name,
+                visit_code=appointment.visit_code,
+                report_datetime=appointment.appt_datetime,
+                study_status=SCHEDULED))
+        CrfOneFormSet = modelformset_factory(
+            CrfOne, form=CrfOneForm, fields='__all__',
+            formset=type('CrfOneFormSet', (OffstudyFormSetMixin, BaseModelFormSet), {}))
+        data = {'form-TOTAL_FORMS': '3', 'form-INITIAL_FORMS': '0'}
+        for index, subject_visit in enumerate(subject_visits + [None]):
+            data.update({
+                f'form-{index}-subject_visit': str(subject_visit.id) if subject_visit else '',
+                f'form-{index}-report_datetime': appointments[index].appt_datetime})
+        formset = CrfOneFormSet(data=data, queryset=CrfOne.objects.none())
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            ['report_datetime' in form.errors for form in formset.forms],
+            [False, True, False])
+        self.assertIn('subject_visit', formset.forms[2].errors)
+        self.assertEqual(
+            formset.forms[1].errors.as_data()['report_datetime'][0].code, SUBJECT_OFFSTUDY)
+        with mock.patch.object(site_offstudy_models, 'get_by_visit_schedule',
+                               side_effect=SiteOffstudyModelsError('blah')):
+            formset = CrfOneFormSet(data=data, queryset=CrfOne.objects.none())
+            self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            [e.code for e in formset.non_form_errors().as_data()],
+            ['offstudy_model', 'offstudy_model'])
+
     @tag('1')
     def test_crf_model_mixin_for_visit_schedule_2(self):
 
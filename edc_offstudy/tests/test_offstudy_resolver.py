@@ -0,0 +1,39 @@
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase
+from edc_base.utils import get_utcnow
+from edc_constants.constants import DEAD
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+from ..offstudy_resolver import OffstudyResolver
+from .models import SubjectConsent, SubjectOffstudy, SubjectOffstudy2
+from .visit_schedule import visit_schedule, visit_schedule2
+
+
+class TestOffstudyResolver(TestCase):
+
+    def setUp(self):
+        site_visit_schedules._registry = {}
+        site_visit_schedules.loaded = False
+        site_visit_schedules.register(visit_schedule)
+        site_visit_schedules.register(visit_schedule2)
+        self.offstudy_datetime = get_utcnow() - relativedelta(weeks=2)
+        for subject_identifier in ['111111111', '222222222']:
+            SubjectConsent.objects.create(
+                subject_identifier=subject_identifier,
+                identity=subject_identifier,
+                confirm_identity=subject_identifier,
+                consent_datetime=get_utcnow() - relativedelta(weeks=4),
+                dob=get_utcnow() - relativedelta(years=25))
+
+    def test_resolver(self):
+        for offstudy_model_cls in [SubjectOffstudy, SubjectOffstudy2]:
+            offstudy_model_cls.objects.create(
+                subject_identifier='111111111',
+                offstudy_datetime=self.offstudy_datetime,
+                offstudy_reason=DEAD)
+        resolver = OffstudyResolver()
+        with self.assertNumQueries(1):
+            resolved = resolver.resolve(['111111111', '222222222'])
+        self.assertEqual(
+            resolved, {'111111111': {'visit_schedule': self.offstudy_datetime,
+                                     'visit_schedule2': self.offstudy_datetime}})
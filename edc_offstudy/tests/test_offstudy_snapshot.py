@@ -0,0 +1,130 @@
+from dateutil.relativedelta import relativedelta
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.test import TransactionTestCase
+from edc_base.utils import get_utcnow
+from edc_consent.site_consents import site_consents
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+from unittest import mock
+
+from ..generations import generations
+from ..offstudy_crf import OffstudyCrf, SubjectOffstudyError
+from ..offstudy_snapshot import offstudy_snapshot
+from .consents import v1_consent
+from .models import Enrollment, SubjectConsent, SubjectOffstudy
+from .visit_schedule import visit_schedule, visit_schedule2
+
+
+class RolledBack(Exception):
+    pass
+
+
+class TestOffstudySnapshot(TransactionTestCase):
+
+    """The snapshot only reads committed data, so these tests
+    do not run inside a transaction.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        site_consents.register(v1_consent)
+        return super().setUpClass()
+
+    def setUp(self):
+        site_visit_schedules._registry = {}
+        site_visit_schedules.loaded = False
+        site_visit_schedules.register(visit_schedule)
+        site_visit_schedules.register(visit_schedule2)
+        self.subject_identifier = '111111111'
+        consent_datetime = get_utcnow() - relativedelta(weeks=4)
+        for subject_identifier in [self.subject_identifier, '222222222']:
+            SubjectConsent.objects.create(
+                subject_identifier=subject_identifier,
+                identity=subject_identifier,
+                confirm_identity=subject_identifier,
+                consent_datetime=consent_datetime,
+                dob=get_utcnow() - relativedelta(years=25))
+            Enrollment.objects.create(
+                subject_identifier=subject_identifier,
+                schedule_name='schedule',
+                report_datetime=consent_datetime,
+                facility_name='default')
+        generations.reset()
+        offstudy_snapshot.reset()
+        self.addCleanup(generations.reset)
+        self.addCleanup(offstudy_snapshot.reset)
+        app_config = django_apps.get_app_config('edc_offstudy')
+        patcher = mock.patch.object(app_config, 'offstudy_snapshot', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.obj = SubjectOffstudy.objects.create(
+            offstudy_datetime=get_utcnow() - relativedelta(days=2),
+            subject_identifier=self.subject_identifier)
+
+    def test_offstudy_snapshot(self):
+        obj = self.obj
+        self.assertEqual(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+            obj.offstudy_datetime)
+        with self.assertNumQueries(0):
+            self.assertRaises(
+                SubjectOffstudyError, OffstudyCrf,
+                subject_identifier=self.subject_identifier,
+                report_datetime=get_utcnow(),
+                offstudy_model_cls=SubjectOffstudy)
+            self.assertIsNone(offstudy_snapshot.get(SubjectOffstudy, '222222222'))
+        obj.offstudy_datetime = get_utcnow() - relativedelta(days=3)
+        obj.save()
+        self.assertEqual(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+            obj.offstudy_datetime)
+        obj.delete()
+        self.assertIsNone(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier))
+
+    def test_offstudy_snapshot_ignores_rolled_back_save(self):
+        offstudy_datetime = self.obj.offstudy_datetime
+        self.assertEqual(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+            offstudy_datetime)
+        try:
+            with transaction.atomic():
+                self.obj.offstudy_datetime = get_utcnow() - relativedelta(days=3)
+                self.obj.save()
+                # this thread's uncommitted change is read from the DB
+                self.assertTrue(generations.pending)
+                self.assertEqual(
+                    offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+                    self.obj.offstudy_datetime)
+                raise RolledBack()
+        except RolledBack:
+            pass
+        self.assertFalse(generations.pending)
+        self.assertEqual(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+            offstudy_datetime)
+        offstudy_snapshot.refresh()
+        self.assertEqual(
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+            offstudy_datetime)
+
+    def test_offstudy_snapshot_not_refreshed_in_transaction(self):
+        offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier)
+        refreshed = offstudy_snapshot.refreshed
+        with transaction.atomic():
+            # as if committed by another thread
+            generations.bump('edc_offstudy.subjectoffstudy')
+            self.assertEqual(
+                offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier),
+                self.obj.offstudy_datetime)
+            self.assertEqual(offstudy_snapshot.refreshed, refreshed)
+        offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier)
+        self.assertNotEqual(offstudy_snapshot.refreshed, refreshed)
+
+    def test_offstudy_snapshot_reloads_periodically(self):
+        offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier)
+        offstudy_snapshot.loaded -= (
+            offstudy_snapshot.refresh_interval * offstudy_snapshot.reload_intervals + 1)
+        with mock.patch.object(offstudy_snapshot, 'load') as load:
+            offstudy_snapshot.get(SubjectOffstudy, self.subject_identifier)
+        load.assert_called_once_with()
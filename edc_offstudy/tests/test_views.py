@@ -0,0 +1,90 @@
+import json
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from edc_base.utils import get_utcnow
+from edc_constants.constants import DEAD
+from edc_registration.models import RegisteredSubject
+from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
+from .models import SubjectConsent, SubjectOffstudy
+from .visit_schedule import visit_schedule, visit_schedule2
+
+
+class TestOffstudyStatusView(TestCase):
+
+    def setUp(self):
+        site_visit_schedules._registry = {}
+        site_visit_schedules.loaded = False
+        site_visit_schedules.register(visit_schedule)
+        site_visit_schedules.register(visit_schedule2)
+        self.user = User.objects.create_user('erik')
+        self.client.force_login(self.user)
+        self.url = reverse('offstudy_status_url')
+        self.consent_datetime = get_utcnow() - relativedelta(weeks=4)
+        self.offstudy_datetime = get_utcnow() - relativedelta(weeks=2)
+        for subject_identifier in ['111111111', '222222222']:
+            SubjectConsent.objects.create(
+                subject_identifier=subject_identifier,
+                identity=subject_identifier,
+                confirm_identity=subject_identifier,
+                consent_datetime=self.consent_datetime,
+                dob=get_utcnow() - relativedelta(years=25))
+        self.assertTrue(RegisteredSubject.objects.filter(
+            subject_identifier='111111111').exists())
+        SubjectOffstudy.objects.create(
+            subject_identifier='111111111',
+            offstudy_datetime=self.offstudy_datetime,
+            offstudy_reason=DEAD)
+
+    def query(self, subject_identifier, report_datetime, name='visit_schedule'):
+        return f'{subject_identifier},{report_datetime.isoformat()},{name}'
+
+    def test_get(self):
+        response = self.client.get(self.url, {'q': [
+            self.query('111111111', get_utcnow()),
+            self.query('111111111', self.consent_datetime),
+            self.query('222222222', get_utcnow())]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json().get('results')
+        self.assertEqual(
+            [result.get('onstudy') for result in results], [False, True, True])
+        self.assertIsNone(results[2].get('offstudy_datetime'))
+
+    def test_get_other_visit_schedule(self):
+        response = self.client.get(self.url, {'q': [
+            self.query('111111111', get_utcnow(), name='visit_schedule2')]})
+        self.assertTrue(response.json().get('results')[0].get('onstudy'))
+
+    def test_get_not_modified(self):
+        data = {'q': [self.query('111111111', get_utcnow())]}
+        response = self.client.get(self.url, data)
+        response = self.client.get(
+            self.url, data, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_post(self):
+        data = dict(queries=[dict(
+            subject_identifier='111111111',
+            report_datetime=self.offstudy_datetime.isoformat(),
+            visit_schedule_name='visit_schedule')], compare_as_datetimes=True)
+        response = self.client.post(
+            self.url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json().get('results')[0].get('onstudy'))
+        self.assertIn('ETag', response)
+
+    def test_bad_query(self):
+        response = self.client.get(
+            self.url, {'q': ['111111111,blah,visit_schedule']})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            self.url, {'q': [self.query('111111111', get_utcnow(), name='blah')]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
@@ -1,6 +1,10 @@
 from django.contrib import admin
 from django.urls import path
 
+from .views import OffstudyStatusView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('offstudy/status/', OffstudyStatusView.as_view(),
+         name='offstudy_status_url'),
 ]
@@ -0,0 +1,48 @@
+from django.apps import apps as django_apps
+from edc_visit_tracking.model_mixins import VisitModelMixin
+
+
+def get_visit_field(model_cls):
+    """Returns the foreign key field of a CRF model that
+    points to the visit model or None.
+    """
+    for field in model_cls._meta.concrete_fields:
+        if field.is_relation and issubclass(field.related_model, VisitModelMixin):
+            return field
+    return None
+
+
+def get_crf_models():
+    """Returns a list of (model_cls, subject_identifier lookup,
+    visit_schedule_name lookup or None) for the CRF and non-CRF
+    models using the edc_offstudy mixins.
+    """
+    from .model_mixins import OffstudyCrfModelMixin, OffstudyNonCrfModelMixin
+    models = []
+    for model_cls in django_apps.get_models():
+        if issubclass(model_cls, OffstudyCrfModelMixin):
+            visit_field = get_visit_field(model_cls)
+            if visit_field:
+                models.append((
+                    model_cls,
+                    f'{visit_field.name}__subject_identifier',
+                    f'{visit_field.name}__visit_schedule_name'))
+        elif issubclass(model_cls, OffstudyNonCrfModelMixin):
+            models.append((model_cls, 'subject_identifier', None))
+    return models
+
+
+def get_appointment_model_cls(visit_model_cls):
+    """Returns the appointment model class configured
+    for the visit model.
+    """
+    app_config = django_apps.get_app_config('edc_appointment')
+    return django_apps.get_model(app_config.get_configuration(
+        related_visit_model=visit_model_cls._meta.label_lower).model)
+
+
+def get_soft_purge():
+    """Returns True if appointments deleted by Offstudy are kept
+    as PurgedAppointment for restore, see AppConfig.soft_purge.
+    """
+    return bool(getattr(django_apps.get_app_config('edc_offstudy'), 'soft_purge', False))
@@ -1,7 +1,9 @@
-from django.apps import apps as django_apps
 from django.core.exceptions import ObjectDoesNotExist
 from django.views.generic.base import ContextMixin
 
+from .offstudy_snapshot import get_offstudy_snapshot
+from .site_offstudy_models import site_offstudy_models, SiteOffstudyModelsError
+
 
 class SubjectOffstudyViewMixinError(Exception):
     pass
@@ -36,8 +38,8 @@ class SubjectOffstudyViewMixin(ContextMixin):
     @property
     def subject_offstudy_model_cls(self):
         try:
-            model_cls = django_apps.get_model(self.subject_offstudy_model)
-        except LookupError as e:
+            model_cls = site_offstudy_models.get_by_label(self.subject_offstudy_model)
+        except SiteOffstudyModelsError as e:
             raise SubjectOffstudyViewMixinError(
                 f'Unable to lookup subject offstudy model. '
                 f'model={self.subject_offstudy_model}. Got {e}')
@@ -48,9 +50,15 @@ class SubjectOffstudyViewMixin(ContextMixin):
         """Returns a model instance either saved or unsaved.
 
         If a save instance does not exits, returns a new unsaved instance.
+
+        If the snapshot is enabled, subjects not off study are
+        answered without a query.
         """
         model_cls = self.subject_offstudy_model_cls
+        snapshot = get_offstudy_snapshot()
         try:
+            if snapshot and not snapshot.get(model_cls, self.subject_identifier):
+                raise model_cls.DoesNotExist()
             subject_offstudy = model_cls.objects.get(
                 subject_identifier=self.subject_identifier)
         except ObjectDoesNotExist:
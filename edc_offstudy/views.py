@@ -0,0 +1,122 @@
+import hashlib
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic.base import View
+
+from .offstudy_crf import is_offstudy
+from .offstudy_resolver import OffstudyResolver
+from .site_offstudy_models import site_offstudy_models, SiteOffstudyModelsError
+
+
+class OffstudyStatusViewError(Exception):
+    pass
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class OffstudyStatusView(LoginRequiredMixin, View):
+
+    """A read-only JSON view that answers "is the subject on study
+    as of report_datetime?" for a batch of queries, using the same
+    comparison as OffstudyCrf.
+
+    GET: ?q=subject_identifier,report_datetime,visit_schedule_name&q=...
+    POST: {"queries": [{"subject_identifier": ..., "report_datetime": ...,
+           "visit_schedule_name": ...}, ...]}
+
+    Optional "compare_as_datetimes" (GET param or JSON key), default
+    False, compares as dates.
+
+    Off-study datetimes are fetched with one query, see
+    OffstudyResolver. Responses carry an ETag of the result; a GET with a
+    matching If-None-Match gets a 304.
+    """
+
+    raise_exception = True
+    max_queries = 1000
+
+    def get(self, request, *args, **kwargs):
+        try:
+            queries = [q.split(',') for q in request.GET.getlist('q')]
+            queries = self.parse_queries(
+                [dict(zip(['subject_identifier', 'report_datetime',
+                           'visit_schedule_name'], q)) for q in queries])
+        except OffstudyStatusViewError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        compare_as_datetimes = request.GET.get('compare_as_datetimes') in ['1', 'true']
+        results = self.get_results(queries, compare_as_datetimes)
+        etag = self.get_etag(results)
+        response = get_conditional_response(request, etag=etag)
+        return response or self.render_results(results, etag)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body.decode())
+            queries = self.parse_queries(data.get('queries') or [])
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({'error': f'Invalid JSON. Got {e}'}, status=400)
+        except OffstudyStatusViewError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        results = self.get_results(queries, data.get('compare_as_datetimes'))
+        return self.render_results(results, self.get_etag(results))
+
+    def parse_queries(self, queries):
+        """Returns a list of (subject_identifier, report_datetime,
+        visit_schedule_name) or raises.
+        """
+        if len(queries) > self.max_queries:
+            raise OffstudyStatusViewError(
+                f'Too many queries. Expected at most {self.max_queries}. '
+                f'Got {len(queries)}.')
+        parsed = []
+        for query in queries:
+            try:
+                report_datetime = parse_datetime(query.get('report_datetime') or '')
+                site_offstudy_models.get_by_visit_schedule(
+                    query.get('visit_schedule_name'))
+            except (ValueError, SiteOffstudyModelsError) as e:
+                raise OffstudyStatusViewError(f'Invalid query {query}. Got {e}')
+            if not report_datetime or not query.get('subject_identifier'):
+                raise OffstudyStatusViewError(f'Invalid query. Got {query}.')
+            if timezone.is_naive(report_datetime):
+                report_datetime = timezone.make_aware(report_datetime)
+            parsed.append((query.get('subject_identifier'), report_datetime,
+                           query.get('visit_schedule_name')))
+        return parsed
+
+    def get_results(self, queries, compare_as_datetimes=None):
+        resolver = OffstudyResolver(
+            visit_schedule_names={query[2] for query in queries})
+        offstudy_datetimes = resolver.resolve({query[0] for query in queries})
+        results = []
+        for subject_identifier, report_datetime, name in queries:
+            offstudy_datetime = offstudy_datetimes.get(
+                subject_identifier, {}).get(name)
+            results.append(dict(
+                subject_identifier=subject_identifier,
+                visit_schedule_name=name,
+                report_datetime=report_datetime.isoformat(),
+                offstudy_datetime=(
+                    offstudy_datetime.isoformat() if offstudy_datetime else None),
+                onstudy=not is_offstudy(
+                    offstudy_datetime=offstudy_datetime,
+                    report_datetime=report_datetime,
+                    compare_as_datetimes=compare_as_datetimes)))
+        return results
+
+    @staticmethod
+    def get_etag(results):
+        return '"{}"'.format(hashlib.md5(
+            json.dumps(results, sort_keys=True).encode()).hexdigest())
+
+    @staticmethod
+    def render_results(results, etag):
+        response = JsonResponse({'results': results})
+        response['ETag'] = etag
+        return response